@@ -21,6 +21,20 @@ from src.routes.users import users_bp
 from src.routes.service_records import service_records_bp
 from src.routes.damage_records import damage_records_bp
 from src.routes.reports import reports_bp
+from src.routes.events import events_bp
+from src.services.availability import reservation_index
+from src.services.query_stats import check_query_counts_command, check_query_plans_command
+from src.services.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+from src.services.rollup import rollup_cli, needs_backfill
+from src.services.migrations import schema_cli, upgrade as upgrade_schema
+from src.services.passwords import PasswordPoolBusy
+from src.services.database import engine_options, pool_status
+from src.services.replica import REPLICA_BIND
+from src.services.metrics import register_instrumentation
+from src.services.seed import seed_cli
+from src.services.benchmark import benchmark_cli
+from src.services.optimizer import optimizer_cli
+from src.services.scheduler import jobs_cli, register_scheduler
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 
@@ -35,10 +49,12 @@ if FRONTEND_URL.startswith('https://'):
 from urllib.parse import urlparse
 frontend_origin = os.environ.get('FRONTEND_URL', '')
 if frontend_origin:
-    CORS(app, resources={r"/api/*": {"origins": [frontend_origin]}}, supports_credentials=True)
+    CORS(app, resources={r"/api/*": {"origins": [frontend_origin]}}, supports_credentials=True,
+         expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER])
 else:
     # Fallback for local dev without credentials
-    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=False)
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=False,
+         expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER])
 
 # Database configuration for PostgreSQL
 DATABASE_URL = os.environ.get('DATABASE_URL')
@@ -51,7 +67,17 @@ else:
     # Fallback to SQLite for local development
     app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 
+# Optional read replica for report and list endpoints
+DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL')
+if DATABASE_READ_URL:
+    if DATABASE_READ_URL.startswith('postgres://'):
+        DATABASE_READ_URL = DATABASE_READ_URL.replace('postgres://', 'postgresql://', 1)
+    app.config['SQLALCHEMY_BINDS'] = {
+        REPLICA_BIND: {'url': DATABASE_READ_URL, **engine_options(DATABASE_READ_URL)}
+    }
+
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/api')
@@ -61,10 +87,30 @@ app.register_blueprint(users_bp, url_prefix='/api')
 app.register_blueprint(service_records_bp, url_prefix='/api')
 app.register_blueprint(damage_records_bp, url_prefix='/api')
 app.register_blueprint(reports_bp, url_prefix='/api')
+app.register_blueprint(events_bp, url_prefix='/api')
 
 # Initialize database
 db.init_app(app)
 
+# Request timing, SQL statistics and /metrics
+register_instrumentation(app)
+register_scheduler(app)
+
+# CLI commands
+app.cli.add_command(check_query_counts_command)
+app.cli.add_command(check_query_plans_command)
+app.cli.add_command(rollup_cli)
+app.cli.add_command(schema_cli)
+app.cli.add_command(seed_cli)
+app.cli.add_command(benchmark_cli)
+app.cli.add_command(optimizer_cli)
+app.cli.add_command(jobs_cli)
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    # Login storms are shed instead of queueing behind the hashing threads
+    return {'error': 'Too many password checks in progress, try again shortly'}, 503, {'Retry-After': '1'}
+
 @app.route('/')
 def serve_frontend():
     return send_from_directory(app.static_folder, 'index.html')
@@ -130,8 +176,11 @@ def create_default_data():
 # --- Ensure database tables exist and default data is seeded on startup (works under gunicorn) ---
 try:
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
         create_default_data()
+        reservation_index.load()
+        if needs_backfill():
+            print("[startup] daily_vehicle_stats is empty; run `flask schema upgrade` to build it", flush=True)
 except Exception as e:
     # Log but don't crash the app
     print(f"[startup] DB init/seed failed: {e}", flush=True)
@@ -142,6 +191,13 @@ except Exception as e:
 def healthz():
     return {'status': 'ok'}, 200
 
+@app.get('/healthz/db')
+def healthz_db():
+    status = pool_status(db.engine)
+    if REPLICA_BIND in db.engines:
+        status['replica'] = pool_status(db.engines[REPLICA_BIND])
+    return status, 200
+
 if __name__ == '__main__':
     create_default_data()
     port = int(os.environ.get('PORT', 5000))
@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.services.passwords import hash_password, verify_password, needs_rehash
+from src.services.replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Role(db.Model):
     __tablename__ = 'roles'
@@ -43,10 +44,13 @@ class User(db.Model):
     reservations = db.relationship('Reservation', backref='user', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
     
     def to_dict(self):
         return {
@@ -119,6 +123,13 @@ class Vehicle(db.Model):
 
 class Reservation(db.Model):
     __tablename__ = 'reservations'
+    __table_args__ = (
+        db.Index('ix_reservations_vehicle_status_time', 'vehicle_id', 'status', 'start_time', 'end_time'),
+        db.Index('ix_reservations_start_time_id', 'start_time', 'id'),
+        db.Index('ix_reservations_created_at', 'created_at'),
+        db.Index('ix_reservations_updated_at', 'updated_at'),
+        db.Index('ix_reservations_user_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -155,6 +166,10 @@ class Reservation(db.Model):
 
 class ServiceRecord(db.Model):
     __tablename__ = 'service_records'
+    __table_args__ = (
+        db.Index('ix_service_records_vehicle_date', 'vehicle_id', 'service_date'),
+        db.Index('ix_service_records_date_id', 'service_date', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
@@ -182,6 +197,10 @@ class ServiceRecord(db.Model):
 
 class DamageRecord(db.Model):
     __tablename__ = 'damage_records'
+    __table_args__ = (
+        db.Index('ix_damage_records_vehicle_date_status', 'vehicle_id', 'damage_date', 'repair_status'),
+        db.Index('ix_damage_records_date_id', 'damage_date', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
@@ -209,3 +228,98 @@ class DamageRecord(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+
+class DailyVehicleStat(db.Model):
+    __tablename__ = 'daily_vehicle_stats'
+    __table_args__ = (
+        db.Index('ix_daily_vehicle_stats_date', 'date'),
+    )
+    
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    reserved_hours = db.Column(db.Float, nullable=False, default=0)  # confirmed hours falling on this day
+    reservation_count = db.Column(db.Integer, nullable=False, default=0)  # confirmed reservations starting this day
+    created_count = db.Column(db.Integer, nullable=False, default=0)  # reservations of any status created this day
+    service_cost = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    damage_cost = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'vehicle_id': self.vehicle_id,
+            'date': self.date.isoformat() if self.date else None,
+            'reserved_hours': self.reserved_hours,
+            'reservation_count': self.reservation_count,
+            'created_count': self.created_count,
+            'service_cost': float(self.service_cost) if self.service_cost else 0,
+            'damage_cost': float(self.damage_cost) if self.damage_cost else 0
+        }
+
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    __table_args__ = (
+        db.Index('ix_revoked_tokens_revoked_at', 'revoked_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True)  # single revoked token; NULL revokes every token of user_id
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)  # entry is useless once every affected token has expired
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)  # table name
+    version = db.Column(db.Integer, nullable=False, default=0)  # bumped in every transaction writing the table
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ScheduledJob(db.Model):
+    __tablename__ = 'scheduled_jobs'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # claimed by moving it forward
+    last_started_at = db.Column(db.DateTime)
+    last_finished_at = db.Column(db.DateTime)
+    last_result = db.Column(db.String(200))
+    last_error = db.Column(db.Text)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'next_run_at': self.next_run_at.isoformat() if self.next_run_at else None,
+            'last_started_at': self.last_started_at.isoformat() if self.last_started_at else None,
+            'last_finished_at': self.last_finished_at.isoformat() if self.last_finished_at else None,
+            'last_result': self.last_result,
+            'last_error': self.last_error
+        }
+
+
+class VehicleAlert(db.Model):
+    __tablename__ = 'vehicle_alerts'
+    __table_args__ = (
+        db.Index('ix_vehicle_alerts_open', 'resolved_at', 'due_date'),
+        db.Index('ix_vehicle_alerts_vehicle_kind', 'vehicle_id', 'kind'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)  # name of the expiring Vehicle date column
+    due_date = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    resolved_at = db.Column(db.DateTime)  # set once the date was renewed or the vehicle archived
+    
+    vehicle = db.relationship('Vehicle')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'vehicle_id': self.vehicle_id,
+            'vehicle_info': f"{self.vehicle.make} {self.vehicle.model} ({self.vehicle.license_plate})" if self.vehicle else None,
+            'kind': self.kind,
+            'due_date': self.due_date.isoformat() if self.due_date else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None
+        }
@@ -1,5 +1,8 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, g
 from src.models.models import User, db
+from src.services.passwords import PasswordPoolBusy, password_pool
+from src.services.principal import Principal, current_principal, load_principal, forget_principal
+from src.services.tokens import InvalidToken, claim_token, decode_token, issue_tokens, revoke_token, tokens_enabled
 from functools import wraps
 
 auth_bp = Blueprint('auth', __name__)
@@ -7,7 +10,8 @@ auth_bp = Blueprint('auth', __name__)
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        principal = current_principal()
+        if not principal or not principal.is_active:
             return jsonify({'error': 'Authentication required'}), 401
         return f(*args, **kwargs)
     return decorated_function
@@ -15,11 +19,11 @@ def login_required(f):
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        principal = current_principal()
+        if not principal or not principal.is_active:
             return jsonify({'error': 'Authentication required'}), 401
         
-        user = User.query.get(session['user_id'])
-        if not user or user.role.name != 'Administrator':
+        if not principal.is_admin:
             return jsonify({'error': 'Administrator privileges required'}), 403
         return f(*args, **kwargs)
     return decorated_function
@@ -35,12 +39,25 @@ def login():
     
     user = User.query.filter_by(username=username).first()
     
-    if user and user.check_password(password) and user.is_active:
+    # Inactive accounts are rejected before spending a password check on them
+    if user and user.is_active and user.check_password(password):
+        # Upgrade hashes made with an older scheme or cost while the password is at hand
+        if user.password_needs_rehash():
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except PasswordPoolBusy:
+                pass
+        
         session['user_id'] = user.id
-        return jsonify({
+        result = {
             'message': 'Login successful',
             'user': user.to_dict()
-        }), 200
+        }
+        if tokens_enabled():
+            principal = Principal(user.id, user.username, user.is_active, user.role_id, user.role.name)
+            result.update(issue_tokens(principal))
+        return jsonify(result), 200
     else:
         return jsonify({'error': 'Invalid credentials or inactive account'}), 401
 
@@ -48,22 +65,66 @@ def login():
 @login_required
 def logout():
     session.pop('user_id', None)
+    g.pop('principal', None)
+    
+    # Token clients revoke the access token they used and, if sent, their refresh token
+    if 'token_claims' in g:
+        revoke_token(g.token_claims)
+        refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+        if refresh_token:
+            try:
+                revoke_token(decode_token(refresh_token, 'refresh'))
+            except InvalidToken:
+                pass
     return jsonify({'message': 'Logout successful'}), 200
 
+@auth_bp.route('/token/refresh', methods=['POST'])
+def refresh_tokens():
+    if not tokens_enabled():
+        return jsonify({'error': 'Token authentication is disabled'}), 404
+    
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if not refresh_token:
+        return jsonify({'error': 'refresh_token is required'}), 400
+    
+    try:
+        claims = decode_token(refresh_token, 'refresh')
+    except InvalidToken:
+        return jsonify({'error': 'Invalid or expired refresh token'}), 401
+    
+    # Refresh tokens are single use; of concurrent refreshes only one claims it
+    if not claim_token(claims):
+        return jsonify({'error': 'Invalid or expired refresh token'}), 401
+    
+    # Role and activation state are re-read so the new access token reflects them
+    user_id = int(claims['sub'])
+    forget_principal(user_id)
+    principal = load_principal(user_id)
+    if not principal or not principal.is_active:
+        return jsonify({'error': 'Invalid credentials or inactive account'}), 401
+    
+    return jsonify(issue_tokens(principal)), 200
+
 @auth_bp.route('/me', methods=['GET'])
 @login_required
 def get_current_user():
-    user = User.query.get(session['user_id'])
+    user = User.query.get(g.principal.id)
     if user:
         return jsonify(user.to_dict()), 200
     else:
         return jsonify({'error': 'User not found'}), 404
 
+@auth_bp.route('/auth/password-pool', methods=['GET'])
+@admin_required
+def get_password_pool_stats():
+    return jsonify(password_pool.stats()), 200
+
 @auth_bp.route('/check-auth', methods=['GET'])
 def check_auth():
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        if user and user.is_active:
+    principal = current_principal()
+    if principal and principal.is_active:
+        user = User.query.get(principal.id)
+        if user:
             return jsonify({
                 'authenticated': True,
                 'user': user.to_dict()
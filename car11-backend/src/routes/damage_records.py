@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
 from src.models.models import DamageRecord, Vehicle, db
 from src.routes.auth import admin_required
+from src.services.pagination import paginated_response
+from src.services.rollup import refresh_record
+from src.services.replica import read_replica
 from datetime import datetime
 import json
 
@@ -8,6 +11,7 @@ damage_records_bp = Blueprint('damage_records', __name__)
 
 @damage_records_bp.route('/damage-records', methods=['GET'])
 @admin_required
+@read_replica()
 def get_damage_records():
     # Get query parameters for filtering
     vehicle_id = request.args.get('vehicle_id', type=int)
@@ -22,8 +26,7 @@ def get_damage_records():
     if repair_status:
         query = query.filter(DamageRecord.repair_status == repair_status)
     
-    damage_records = query.order_by(DamageRecord.damage_date.desc()).all()
-    return jsonify([record.to_dict() for record in damage_records])
+    return paginated_response(query, [(DamageRecord.damage_date, True), (DamageRecord.id, True)], 'damage_record')
 
 @damage_records_bp.route('/damage-records/<int:record_id>', methods=['GET'])
 @admin_required
@@ -58,6 +61,7 @@ def create_damage_record():
     )
     
     db.session.add(record)
+    refresh_record(record.vehicle_id, damage_date)
     db.session.commit()
     return jsonify(record.to_dict()), 201
 
@@ -66,6 +70,7 @@ def create_damage_record():
 def update_damage_record(record_id):
     record = DamageRecord.query.get_or_404(record_id)
     data = request.get_json()
+    previous_date = record.damage_date
     
     # Update basic fields
     for field in ['description', 'estimated_cost', 'actual_cost', 'repair_status']:
@@ -84,6 +89,7 @@ def update_damage_record(record_id):
     if 'photos' in data:
         record.photos = json.dumps(data['photos']) if data['photos'] else None
     
+    refresh_record(record.vehicle_id, previous_date, record.damage_date)
     db.session.commit()
     return jsonify(record.to_dict())
 
@@ -92,6 +98,7 @@ def update_damage_record(record_id):
 def delete_damage_record(record_id):
     record = DamageRecord.query.get_or_404(record_id)
     db.session.delete(record)
+    refresh_record(record.vehicle_id, record.damage_date)
     db.session.commit()
     return '', 204
 
@@ -0,0 +1,86 @@
+import json
+import os
+import queue
+import threading
+import time
+from flask import Blueprint, Response, jsonify, request
+from src.routes.auth import login_required
+from src.services.events import event_broker, resync_event
+
+events_bp = Blueprint('events', __name__)
+
+# Streams end after this many seconds and the browser reconnects with
+# Last-Event-ID; each open stream holds one gunicorn thread meanwhile.
+STREAM_DURATION = int(os.environ.get('EVENTS_STREAM_DURATION', 300))
+# Open streams per worker. Each one holds a request thread while it mostly
+# sleeps, so workers run more threads than the API needs and streams get the
+# surplus: every thread beyond API_THREADS. Streams beyond it get 503 and
+# retry later.
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+API_THREADS = int(os.environ.get('API_THREADS', 4))
+MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', max(GUNICORN_THREADS - API_THREADS, 1)))
+HEARTBEAT_INTERVAL = 15
+RECONNECT_DELAY_MS = 2000
+BUSY_RETRY_AFTER = 30
+
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+
+def _format(item):
+    return f"id: {item['id']}\nevent: {item['type']}\ndata: {json.dumps(item['data'])}\n\n"
+
+
+@events_bp.route('/events', methods=['GET'])
+@login_required
+def stream_events():
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many open event streams, try again later'}), 503, \
+            {'Retry-After': str(BUSY_RETRY_AFTER)}
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        subscriber = event_broker.subscribe(last_event_id)
+    except Exception:
+        _stream_slots.release()
+        raise
+    closed = threading.Event()
+    
+    # Runs when the stream ends or the server closes a response that was never
+    # iterated, whichever comes first
+    def close():
+        if not closed.is_set():
+            closed.set()
+            event_broker.unsubscribe(subscriber)
+            _stream_slots.release()
+    
+    # Runs after the request context is gone, so it must not touch g or db
+    def generate():
+        deadline = time.monotonic() + STREAM_DURATION
+        resync_interval = event_broker.resync_interval
+        next_resync = time.monotonic() + resync_interval if resync_interval else None
+        try:
+            yield f'retry: {RECONNECT_DELAY_MS}\n\n'
+            while time.monotonic() < deadline:
+                if next_resync is not None and time.monotonic() >= next_resync:
+                    # Other workers' changes are not delivered here
+                    next_resync += resync_interval
+                    yield _format(resync_event())
+                    continue
+                timeout = HEARTBEAT_INTERVAL
+                if next_resync is not None:
+                    timeout = max(min(timeout, next_resync - time.monotonic()), 0)
+                try:
+                    item = subscriber.get(timeout=timeout)
+                except queue.Empty:
+                    if next_resync is None or time.monotonic() < next_resync:
+                        yield ': keep-alive\n\n'
+                    continue
+                yield _format(item)
+        finally:
+            close()
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.call_on_close(close)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keeps reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,84 +1,112 @@
-from flask import Blueprint, request, jsonify, make_response
-from src.models.models import Vehicle, User, Reservation, ServiceRecord, DamageRecord, db
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from src.models.models import Vehicle, User, Reservation, ServiceRecord, DamageRecord, DailyVehicleStat, db
 from src.routes.auth import admin_required
+from src.services.sql_functions import year_month
+from src.services.cache import TTLCache, invalidate_on_commit
+from src.services.replica import read_replica, REPORT_MAX_STALENESS
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, extract
+from sqlalchemy import func, and_, case, true
+import os
 import csv
 import io
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
 
 reports_bp = Blueprint('reports', __name__)
 
+COST_BREAKDOWNS = ('month', 'service_type', 'service_provider')
+
+EXPORT_TYPES = ('vehicle-utilization', 'cost-analysis', 'reservation-statistics',
+                'reservations', 'service-records', 'damage-records')
+EXPORT_BATCH_SIZE = 1000
+
+# Dashboard statistics are shared by all administrators and cached briefly;
+# any committed write to the counted tables clears the cache.
+dashboard_cache = TTLCache(ttl=int(os.environ.get('DASHBOARD_CACHE_TTL', 30)))
+invalidate_on_commit(dashboard_cache, Vehicle, User, Reservation, ServiceRecord, DamageRecord)
+
+def _money(value):
+    """Round an exact Decimal sum to cents for the JSON response"""
+    return float(Decimal(value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
 @reports_bp.route('/dashboard', methods=['GET'])
 @admin_required
+@read_replica(REPORT_MAX_STALENESS)
 def get_dashboard():
+    return jsonify(dashboard_cache.get_or_set('dashboard', _dashboard_statistics))
+
+def _month_start(moment, months_back):
+    """First day of the calendar month months_back months before moment"""
+    month_index = moment.year * 12 + moment.month - 1 - months_back
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def _dashboard_statistics():
     # Current date for calculations
     now = datetime.now()
-    current_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    current_month_start = _month_start(now, 0)
     last_30_days = now - timedelta(days=30)
-    last_6_months = now - timedelta(days=180)
     
-    # Basic counts
-    total_active_vehicles = Vehicle.query.filter_by(is_archived=False).count()
-    total_active_users = User.query.filter_by(is_active=True).count()
+    # Last six calendar months, oldest first
+    trend_months = [_month_start(now, i) for i in range(5, -1, -1)]
+    trend_bounds = list(zip(trend_months, trend_months[1:] + [_month_start(now, -1)]))
     
-    # Monthly reservations
-    monthly_reservations = Reservation.query.filter(
-        Reservation.created_at >= current_month_start
-    ).count()
+    # Every counter is a conditional aggregate over its table; the single-row
+    # aggregates are cross joined so the whole dashboard is one statement
+    vehicle_counts = db.session.query(
+        func.count(case((Vehicle.is_archived == False, 1))).label('total_active_vehicles'),
+        func.count(case((Vehicle.status == 'V udrzbe', 1))).label('vehicles_in_maintenance')
+    ).subquery()
     
-    # Currently active reservations (ongoing trips)
-    active_reservations = Reservation.query.filter(
-        and_(
+    user_counts = db.session.query(
+        func.count(case((User.is_active == True, 1))).label('total_active_users')
+    ).subquery()
+    
+    reservation_counts = db.session.query(
+        func.count(case((Reservation.created_at >= current_month_start, 1))).label('monthly_reservations'),
+        func.count(case((and_(
             Reservation.status == 'Potvrzena',
             Reservation.start_time <= now,
             Reservation.end_time > now
-        )
-    ).count()
-    
-    # Vehicles in maintenance
-    vehicles_in_maintenance = Vehicle.query.filter_by(status='V udrzbe').count()
-    
-    # Service records in last 30 days
-    recent_services = ServiceRecord.query.filter(
-        ServiceRecord.created_at >= last_30_days
-    ).count()
-    
-    # Unresolved damage records
-    unresolved_damages = DamageRecord.query.filter_by(repair_status='Ceka na opravu').count()
-    
-    # Reservation trend for last 6 months
-    reservation_trend = []
-    for i in range(6):
-        month_start = (now.replace(day=1) - timedelta(days=i*30)).replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1)
-        
-        count = Reservation.query.filter(
-            and_(
-                Reservation.created_at >= month_start,
-                Reservation.created_at < month_end
-            )
-        ).count()
-        
-        reservation_trend.append({
+        ), 1))).label('active_reservations'),
+        *[func.count(case((and_(
+            Reservation.created_at >= month_start,
+            Reservation.created_at < month_end
+        ), 1))).label(f'trend_{i}') for i, (month_start, month_end) in enumerate(trend_bounds)]
+    ).subquery()
+    
+    service_counts = db.session.query(
+        func.count(case((ServiceRecord.created_at >= last_30_days, 1))).label('recent_services')
+    ).subquery()
+    
+    damage_counts = db.session.query(
+        func.count(case((DamageRecord.repair_status == 'Ceka na opravu', 1))).label('unresolved_damages')
+    ).subquery()
+    
+    row = db.session.query(vehicle_counts, user_counts, reservation_counts, service_counts, damage_counts) \
+        .select_from(vehicle_counts) \
+        .join(user_counts, true()) \
+        .join(reservation_counts, true()) \
+        .join(service_counts, true()) \
+        .join(damage_counts, true()) \
+        .one()._mapping
+    
+    return {
+        'total_active_vehicles': row['total_active_vehicles'],
+        'total_active_users': row['total_active_users'],
+        'monthly_reservations': row['monthly_reservations'],
+        'active_reservations': row['active_reservations'],
+        'vehicles_in_maintenance': row['vehicles_in_maintenance'],
+        'recent_services': row['recent_services'],
+        'unresolved_damages': row['unresolved_damages'],
+        'reservation_trend': [{
             'month': month_start.strftime('%Y-%m'),
-            'count': count
-        })
-    
-    reservation_trend.reverse()  # Show oldest to newest
-    
-    return jsonify({
-        'total_active_vehicles': total_active_vehicles,
-        'total_active_users': total_active_users,
-        'monthly_reservations': monthly_reservations,
-        'active_reservations': active_reservations,
-        'vehicles_in_maintenance': vehicles_in_maintenance,
-        'recent_services': recent_services,
-        'unresolved_damages': unresolved_damages,
-        'reservation_trend': reservation_trend
-    })
+            'count': row[f'trend_{i}']
+        } for i, (month_start, month_end) in enumerate(trend_bounds)]
+    }
 
 @reports_bp.route('/vehicle-utilization', methods=['GET'])
 @admin_required
+@read_replica(REPORT_MAX_STALENESS)
 def get_vehicle_utilization():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -95,36 +123,42 @@ def get_vehicle_utilization():
     # Calculate total period in hours
     total_period_hours = (end_dt - start_dt).total_seconds() / 3600
     
-    # Get all vehicles
-    vehicles = Vehicle.query.filter_by(is_archived=False).all()
+    # Reserved hours per vehicle from the daily rollup. Hours are split per
+    # day there, so reservations straddling the period only count their
+    # overlapping part; reservation_count counts reservations starting in it.
+    rows = db.session.query(
+        Vehicle.id,
+        Vehicle.make,
+        Vehicle.model,
+        Vehicle.license_plate,
+        func.coalesce(func.sum(DailyVehicleStat.reserved_hours), 0),
+        func.coalesce(func.sum(DailyVehicleStat.reservation_count), 0)
+    ).outerjoin(
+        DailyVehicleStat,
+        and_(
+            DailyVehicleStat.vehicle_id == Vehicle.id,
+            DailyVehicleStat.date >= start_dt.date(),
+            DailyVehicleStat.date < end_dt.date()
+        )
+    ).filter(
+        Vehicle.is_archived == False
+    ).group_by(
+        Vehicle.id, Vehicle.make, Vehicle.model, Vehicle.license_plate
+    ).order_by(Vehicle.id).all()
     
     utilization_data = []
-    for vehicle in vehicles:
-        # Get confirmed reservations for this vehicle in the period
-        reservations = Reservation.query.filter(
-            and_(
-                Reservation.vehicle_id == vehicle.id,
-                Reservation.status == 'Potvrzena',
-                Reservation.start_time >= start_dt,
-                Reservation.end_time < end_dt
-            )
-        ).all()
-        
-        # Calculate total reserved hours
-        total_reserved_hours = 0
-        for reservation in reservations:
-            duration = (reservation.end_time - reservation.start_time).total_seconds() / 3600
-            total_reserved_hours += duration
+    for vehicle_id, make, model, license_plate, total_reserved_hours, reservation_count in rows:
+        total_reserved_hours = float(total_reserved_hours)
         
         # Calculate utilization percentage
         utilization_percentage = (total_reserved_hours / total_period_hours * 100) if total_period_hours > 0 else 0
         
         utilization_data.append({
-            'vehicle_id': vehicle.id,
-            'vehicle_info': f"{vehicle.make} {vehicle.model} ({vehicle.license_plate})",
+            'vehicle_id': vehicle_id,
+            'vehicle_info': f"{make} {model} ({license_plate})",
             'total_reserved_hours': round(total_reserved_hours, 2),
             'utilization_percentage': round(utilization_percentage, 2),
-            'reservation_count': len(reservations)
+            'reservation_count': reservation_count
         })
     
     # Sort by utilization percentage descending
@@ -134,6 +168,7 @@ def get_vehicle_utilization():
 
 @reports_bp.route('/cost-analysis', methods=['GET'])
 @admin_required
+@read_replica(REPORT_MAX_STALENESS)
 def get_cost_analysis():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -147,60 +182,106 @@ def get_cost_analysis():
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
     
-    # Get all vehicles
-    vehicles = Vehicle.query.filter_by(is_archived=False).all()
-    
-    cost_data = []
-    total_service_costs = 0
-    total_damage_costs = 0
+    breakdowns = [b for b in request.args.get('breakdown', '').split(',') if b]
+    invalid = [b for b in breakdowns if b not in COST_BREAKDOWNS]
+    if invalid:
+        return jsonify({'error': f"Invalid breakdown: {', '.join(invalid)}"}), 400
     
-    for vehicle in vehicles:
-        # Get service costs for this vehicle in the period
-        service_costs = db.session.query(func.sum(ServiceRecord.cost)).filter(
+    # Get all vehicles
+    vehicles = Vehicle.query.filter_by(is_archived=False).order_by(Vehicle.id).all()
+    
+    # Per-vehicle totals (and the month breakdown) come from the daily rollup
+    month_columns = [year_month(DailyVehicleStat.date)] if 'month' in breakdowns else []
+    cost_rows = db.session.query(
+        DailyVehicleStat.vehicle_id,
+        *month_columns,
+        func.sum(DailyVehicleStat.service_cost),
+        func.sum(DailyVehicleStat.damage_cost)
+    ).join(Vehicle).filter(
+        and_(
+            Vehicle.is_archived == False,
+            DailyVehicleStat.date >= start_dt,
+            DailyVehicleStat.date <= end_dt
+        )
+    ).group_by(DailyVehicleStat.vehicle_id, *month_columns).all()
+    
+    # Merge in memory, summing with Decimal so no precision is lost
+    service_costs = defaultdict(Decimal)
+    damage_costs = defaultdict(Decimal)
+    breakdown_costs = {b: defaultdict(lambda: [Decimal(0), Decimal(0)]) for b in breakdowns}
+    
+    for vehicle_id, *keys, service_cost, damage_cost in cost_rows:
+        service_costs[vehicle_id] += Decimal(service_cost or 0)
+        damage_costs[vehicle_id] += Decimal(damage_cost or 0)
+        if keys:
+            breakdown_costs['month'][keys[0]][0] += Decimal(service_cost or 0)
+            breakdown_costs['month'][keys[0]][1] += Decimal(damage_cost or 0)
+    
+    # Service type and provider are not part of the rollup; both are served
+    # by one grouped query over the raw service records
+    record_breakdowns = [b for b in breakdowns if b != 'month']
+    if record_breakdowns:
+        record_columns = [getattr(ServiceRecord, b) for b in record_breakdowns]
+        service_rows = db.session.query(
+            *record_columns,
+            func.sum(ServiceRecord.cost)
+        ).join(Vehicle).filter(
             and_(
-                ServiceRecord.vehicle_id == vehicle.id,
+                Vehicle.is_archived == False,
                 ServiceRecord.service_date >= start_dt,
                 ServiceRecord.service_date <= end_dt,
                 ServiceRecord.cost.isnot(None)
             )
-        ).scalar() or 0
+        ).group_by(*record_columns).all()
         
-        # Get damage repair costs for this vehicle in the period
-        damage_costs = db.session.query(func.sum(DamageRecord.actual_cost)).filter(
-            and_(
-                DamageRecord.vehicle_id == vehicle.id,
-                DamageRecord.damage_date >= start_dt,
-                DamageRecord.damage_date <= end_dt,
-                DamageRecord.actual_cost.isnot(None)
-            )
-        ).scalar() or 0
-        
-        vehicle_total = float(service_costs) + float(damage_costs)
-        total_service_costs += float(service_costs)
-        total_damage_costs += float(damage_costs)
+        for *keys, cost in service_rows:
+            for b, key in zip(record_breakdowns, keys):
+                breakdown_costs[b][key][0] += Decimal(cost)
+    
+    cost_data = []
+    for vehicle in vehicles:
+        vehicle_service = service_costs[vehicle.id]
+        vehicle_damage = damage_costs[vehicle.id]
         
         cost_data.append({
             'vehicle_id': vehicle.id,
             'vehicle_info': f"{vehicle.make} {vehicle.model} ({vehicle.license_plate})",
-            'service_costs': float(service_costs),
-            'damage_costs': float(damage_costs),
-            'total_costs': vehicle_total
+            'service_costs': _money(vehicle_service),
+            'damage_costs': _money(vehicle_damage),
+            'total_costs': _money(vehicle_service + vehicle_damage)
         })
     
     # Sort by total costs descending
     cost_data.sort(key=lambda x: x['total_costs'], reverse=True)
     
-    return jsonify({
+    total_service_costs = sum(service_costs.values(), Decimal(0))
+    total_damage_costs = sum(damage_costs.values(), Decimal(0))
+    
+    result = {
         'vehicles': cost_data,
         'summary': {
-            'total_service_costs': total_service_costs,
-            'total_damage_costs': total_damage_costs,
-            'grand_total': total_service_costs + total_damage_costs
+            'total_service_costs': _money(total_service_costs),
+            'total_damage_costs': _money(total_damage_costs),
+            'grand_total': _money(total_service_costs + total_damage_costs)
         }
-    })
+    }
+    
+    if breakdowns:
+        result['breakdown'] = {
+            b: [{
+                b: key,
+                'service_costs': _money(service),
+                'damage_costs': _money(damage),
+                'total_costs': _money(service + damage)
+            } for key, (service, damage) in sorted(breakdown_costs[b].items(), key=lambda item: (item[0] is None, item[0] or ''))]
+            for b in breakdowns
+        }
+    
+    return jsonify(result)
 
 @reports_bp.route('/reservation-statistics', methods=['GET'])
 @admin_required
+@read_replica(REPORT_MAX_STALENESS)
 def get_reservation_statistics():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -242,16 +323,26 @@ def get_reservation_statistics():
     
     top_users_data = [{'user_name': name, 'reservation_count': count} for name, count in top_users]
     
-    # Top 10 most popular vehicles
-    top_vehicles = db.session.query(
+    # Top 10 most popular vehicles, from the daily rollup
+    top_vehicles_query = db.session.query(
         Vehicle.make,
         Vehicle.model,
         Vehicle.license_plate,
-        func.count(Reservation.id).label('reservation_count')
-    ).join(Reservation).filter(
-        Reservation.id.in_(base_query.with_entities(Reservation.id))
-    ).group_by(Vehicle.id, Vehicle.make, Vehicle.model, Vehicle.license_plate).order_by(
-        func.count(Reservation.id).desc()
+        func.sum(DailyVehicleStat.created_count).label('reservation_count')
+    ).join(DailyVehicleStat)
+    if start_date and end_date:
+        top_vehicles_query = top_vehicles_query.filter(
+            and_(
+                DailyVehicleStat.date >= start_dt.date(),
+                DailyVehicleStat.date < end_dt.date()
+            )
+        )
+    top_vehicles = top_vehicles_query.group_by(
+        Vehicle.id, Vehicle.make, Vehicle.model, Vehicle.license_plate
+    ).having(
+        func.sum(DailyVehicleStat.created_count) > 0
+    ).order_by(
+        func.sum(DailyVehicleStat.created_count).desc()
     ).limit(10).all()
     
     top_vehicles_data = [{
@@ -261,18 +352,21 @@ def get_reservation_statistics():
     
     # Daily reservation overview (last 30 days if no date range specified)
     if not start_date or not end_date:
-        start_dt = datetime.now() - timedelta(days=30)
-        end_dt = datetime.now()
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start_dt = today - timedelta(days=30)
+        end_dt = today + timedelta(days=1)
     
     daily_reservations = db.session.query(
-        func.date(Reservation.created_at).label('date'),
-        func.count(Reservation.id).label('count')
+        DailyVehicleStat.date,
+        func.sum(DailyVehicleStat.created_count).label('count')
     ).filter(
         and_(
-            Reservation.created_at >= start_dt,
-            Reservation.created_at < end_dt
+            DailyVehicleStat.date >= start_dt.date(),
+            DailyVehicleStat.date < end_dt.date()
         )
-    ).group_by(func.date(Reservation.created_at)).order_by('date').all()
+    ).group_by(DailyVehicleStat.date).having(
+        func.sum(DailyVehicleStat.created_count) > 0
+    ).order_by(DailyVehicleStat.date).all()
     
     daily_data = [{'date': str(date), 'count': count} for date, count in daily_reservations]
     
@@ -283,85 +377,181 @@ def get_reservation_statistics():
         'daily_overview': daily_data
     })
 
+def _csv_lines(rows):
+    """Encode rows as CSV one line at a time so exports can be streamed"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+def _export_period():
+    """Optional start_date/end_date arguments of raw exports as [start, end) datetimes"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+    end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+    return start_dt, end_dt
+
+def _reservation_export_rows(start_dt, end_dt):
+    yield ['ID', 'User', 'Vehicle', 'Start', 'End', 'Purpose', 'Destination',
+           'Passengers', 'Status', 'Created']
+    
+    query = db.session.query(
+        Reservation.id, User.full_name, Vehicle.make, Vehicle.model, Vehicle.license_plate,
+        Reservation.start_time, Reservation.end_time, Reservation.purpose, Reservation.destination,
+        Reservation.passenger_count, Reservation.status, Reservation.created_at
+    ).join(User, Reservation.user_id == User.id).join(Vehicle, Reservation.vehicle_id == Vehicle.id)
+    
+    # Every reservation overlapping the period, whatever its status
+    if start_dt:
+        query = query.filter(Reservation.end_time > start_dt)
+    if end_dt:
+        query = query.filter(Reservation.start_time < end_dt)
+    
+    for (reservation_id, user_name, make, model, license_plate, start_time, end_time, purpose,
+         destination, passenger_count, status, created_at) in _stream(query.order_by(Reservation.start_time, Reservation.id)):
+        yield [reservation_id, user_name, f"{make} {model} ({license_plate})",
+               start_time.isoformat(), end_time.isoformat(), purpose, destination,
+               passenger_count, status, created_at.isoformat() if created_at else None]
+
+def _service_record_export_rows(start_dt, end_dt):
+    yield ['ID', 'Vehicle', 'Service Date', 'Service Type', 'Description', 'Cost', 'Service Provider']
+    
+    query = db.session.query(
+        ServiceRecord.id, Vehicle.make, Vehicle.model, Vehicle.license_plate,
+        ServiceRecord.service_date, ServiceRecord.service_type, ServiceRecord.description,
+        ServiceRecord.cost, ServiceRecord.service_provider
+    ).join(Vehicle, ServiceRecord.vehicle_id == Vehicle.id)
+    
+    if start_dt:
+        query = query.filter(ServiceRecord.service_date >= start_dt.date())
+    if end_dt:
+        query = query.filter(ServiceRecord.service_date < end_dt.date())
+    
+    for (record_id, make, model, license_plate, service_date, service_type, description,
+         cost, service_provider) in _stream(query.order_by(ServiceRecord.service_date, ServiceRecord.id)):
+        yield [record_id, f"{make} {model} ({license_plate})", service_date.isoformat(),
+               service_type, description, cost, service_provider]
+
+def _damage_record_export_rows(start_dt, end_dt):
+    yield ['ID', 'Vehicle', 'Damage Date', 'Description', 'Estimated Cost', 'Actual Cost', 'Repair Status']
+    
+    query = db.session.query(
+        DamageRecord.id, Vehicle.make, Vehicle.model, Vehicle.license_plate,
+        DamageRecord.damage_date, DamageRecord.description, DamageRecord.estimated_cost,
+        DamageRecord.actual_cost, DamageRecord.repair_status
+    ).join(Vehicle, DamageRecord.vehicle_id == Vehicle.id)
+    
+    if start_dt:
+        query = query.filter(DamageRecord.damage_date >= start_dt.date())
+    if end_dt:
+        query = query.filter(DamageRecord.damage_date < end_dt.date())
+    
+    for (record_id, make, model, license_plate, damage_date, description, estimated_cost,
+         actual_cost, repair_status) in _stream(query.order_by(DamageRecord.damage_date, DamageRecord.id)):
+        yield [record_id, f"{make} {model} ({license_plate})", damage_date.isoformat(),
+               description, estimated_cost, actual_cost, repair_status]
+
+def _stream(query):
+    """Iterate a query in batches from a server-side cursor where the driver supports one"""
+    return query.execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+
+def _report_rows(view, rows_from_data):
+    """Run a JSON report view and turn its data into CSV rows.
+
+    Returns the view's error response unchanged when it did not succeed.
+    """
+    response = view()
+    if isinstance(response, tuple):
+        return None, response
+    return rows_from_data(response.get_json()), None
+
+def _vehicle_utilization_rows(data):
+    yield ['Vehicle', 'Reserved Hours', 'Utilization %', 'Reservations']
+    for item in data:
+        yield [
+            item['vehicle_info'],
+            item['total_reserved_hours'],
+            item['utilization_percentage'],
+            item['reservation_count']
+        ]
+
+def _cost_analysis_rows(data):
+    yield ['Vehicle', 'Service Costs', 'Damage Costs', 'Total Costs']
+    for item in data['vehicles']:
+        yield [
+            item['vehicle_info'],
+            item['service_costs'],
+            item['damage_costs'],
+            item['total_costs']
+        ]
+    # Add summary row
+    yield ['TOTAL', data['summary']['total_service_costs'],
+           data['summary']['total_damage_costs'], data['summary']['grand_total']]
+
+def _reservation_statistics_rows(data):
+    # Status breakdown
+    yield ['Status Breakdown']
+    yield ['Status', 'Count']
+    for item in data['status_breakdown']:
+        yield [item['status'], item['count']]
+    
+    yield []  # Empty row
+    
+    # Top users
+    yield ['Top Users']
+    yield ['User Name', 'Reservation Count']
+    for item in data['top_users']:
+        yield [item['user_name'], item['reservation_count']]
+    
+    yield []  # Empty row
+    
+    # Top vehicles
+    yield ['Top Vehicles']
+    yield ['Vehicle', 'Reservation Count']
+    for item in data['top_vehicles']:
+        yield [item['vehicle_info'], item['reservation_count']]
+
 @reports_bp.route('/export/<report_type>', methods=['GET'])
 @admin_required
+@read_replica(REPORT_MAX_STALENESS)
 def export_report(report_type):
-    if report_type not in ['vehicle-utilization', 'cost-analysis', 'reservation-statistics']:
+    if report_type not in EXPORT_TYPES:
         return jsonify({'error': 'Invalid report type'}), 400
     
-    # Get the report data
-    if report_type == 'vehicle-utilization':
-        response_data = get_vehicle_utilization()
-        data = response_data.get_json()
-        filename = 'vehicle_utilization.csv'
-        
-        # Create CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Vehicle', 'Reserved Hours', 'Utilization %', 'Reservations'])
-        for item in data:
-            writer.writerow([
-                item['vehicle_info'],
-                item['total_reserved_hours'],
-                item['utilization_percentage'],
-                item['reservation_count']
-            ])
+    filename = f"{report_type.replace('-', '_')}.csv"
     
+    # Aggregated reports reuse their JSON views
+    if report_type == 'vehicle-utilization':
+        rows, error = _report_rows(get_vehicle_utilization, _vehicle_utilization_rows)
     elif report_type == 'cost-analysis':
-        response_data = get_cost_analysis()
-        data = response_data.get_json()
-        filename = 'cost_analysis.csv'
-        
-        # Create CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Vehicle', 'Service Costs', 'Damage Costs', 'Total Costs'])
-        for item in data['vehicles']:
-            writer.writerow([
-                item['vehicle_info'],
-                item['service_costs'],
-                item['damage_costs'],
-                item['total_costs']
-            ])
-        # Add summary row
-        writer.writerow(['TOTAL', data['summary']['total_service_costs'], 
-                        data['summary']['total_damage_costs'], data['summary']['grand_total']])
-    
+        rows, error = _report_rows(get_cost_analysis, _cost_analysis_rows)
     elif report_type == 'reservation-statistics':
-        response_data = get_reservation_statistics()
-        data = response_data.get_json()
-        filename = 'reservation_statistics.csv'
-        
-        # Create CSV with multiple sections
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Status breakdown
-        writer.writerow(['Status Breakdown'])
-        writer.writerow(['Status', 'Count'])
-        for item in data['status_breakdown']:
-            writer.writerow([item['status'], item['count']])
-        
-        writer.writerow([])  # Empty row
-        
-        # Top users
-        writer.writerow(['Top Users'])
-        writer.writerow(['User Name', 'Reservation Count'])
-        for item in data['top_users']:
-            writer.writerow([item['user_name'], item['reservation_count']])
-        
-        writer.writerow([])  # Empty row
+        rows, error = _report_rows(get_reservation_statistics, _reservation_statistics_rows)
+    
+    # Raw record exports read straight from the database while streaming
+    else:
+        try:
+            start_dt, end_dt = _export_period()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
         
-        # Top vehicles
-        writer.writerow(['Top Vehicles'])
-        writer.writerow(['Vehicle', 'Reservation Count'])
-        for item in data['top_vehicles']:
-            writer.writerow([item['vehicle_info'], item['reservation_count']])
-    
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
+        if report_type == 'reservations':
+            rows = _reservation_export_rows(start_dt, end_dt)
+        elif report_type == 'service-records':
+            rows = _service_record_export_rows(start_dt, end_dt)
+        else:
+            rows = _damage_record_export_rows(start_dt, end_dt)
+        error = None
+    
+    if error:
+        return error
+    
+    # Stream the CSV line by line instead of building it in memory
+    response = Response(stream_with_context(_csv_lines(rows)), mimetype='text/csv')
     response.headers['Content-Disposition'] = f'attachment; filename={filename}'
     
     return response
-
@@ -1,15 +1,39 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, g
 from src.models.models import Reservation, Vehicle, User, db
 from src.routes.auth import login_required, admin_required
+from src.services.availability import reservation_index, has_conflict, occupying_filter, find_batch_conflicts, lock_vehicles, naive_utc
+from src.services.serialization import serialize_all
+from src.services.pagination import paginated_response
+from src.services.rollup import refresh_bookings, refresh_reservation, reservation_days
+from src.services.recurrence import iter_occurrences, InvalidRecurrence
+from src.services.allocation import rank_vehicles
+from src.services.replica import read_replica
+from src.services.conditional import make_etag, not_modified, with_validator
 from datetime import datetime, timedelta
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func
 
 reservations_bp = Blueprint('reservations', __name__)
 
+# Upper bound on the bookings one bulk request may expand to
+BULK_MAX_BOOKINGS = 500
+# Allocation re-ranks when a concurrent booking took the chosen vehicle
+ALLOCATION_ATTEMPTS = 3
+
+def parse_passenger_count(value):
+    """Positive integer passenger count, or None when value is not one"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        count = int(value)
+    except ValueError:
+        return None
+    return count if count >= 1 else None
+
 @reservations_bp.route('/reservations', methods=['GET'])
 @login_required
+@read_replica()
 def get_reservations():
-    user = User.query.get(session['user_id'])
+    user = g.principal
     
     # Get query parameters for filtering
     vehicle_id = request.args.get('vehicle_id', type=int)
@@ -18,7 +42,7 @@ def get_reservations():
     end_date = request.args.get('end_date')
     
     # Base query - admins see all, employees see only their own
-    if user.role.name == 'Administrator':
+    if user.is_admin:
         query = Reservation.query
     else:
         query = Reservation.query.filter(Reservation.user_id == user.id)
@@ -38,17 +62,16 @@ def get_reservations():
         end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
         query = query.filter(Reservation.end_time < end_dt)
     
-    reservations = query.order_by(Reservation.start_time.desc()).all()
-    return jsonify([reservation.to_dict() for reservation in reservations])
+    return paginated_response(query, [(Reservation.start_time, True), (Reservation.id, True)], 'reservation')
 
 @reservations_bp.route('/reservations/<int:reservation_id>', methods=['GET'])
 @login_required
 def get_reservation(reservation_id):
-    user = User.query.get(session['user_id'])
+    user = g.principal
     reservation = Reservation.query.get_or_404(reservation_id)
     
     # Check permissions - users can only see their own reservations
-    if user.role.name != 'Administrator' and reservation.user_id != user.id:
+    if not user.is_admin and reservation.user_id != user.id:
         return jsonify({'error': 'Access denied'}), 403
     
     return jsonify(reservation.to_dict())
@@ -56,7 +79,7 @@ def get_reservation(reservation_id):
 @reservations_bp.route('/reservations', methods=['POST'])
 @login_required
 def create_reservation():
-    user = User.query.get(session['user_id'])
+    user = g.principal
     data = request.get_json()
     
     # Parse datetime strings
@@ -81,25 +104,16 @@ def create_reservation():
     if vehicle.is_archived or vehicle.status != 'Aktivni':
         return jsonify({'error': 'Vehicle is not available for reservation'}), 400
     
-    # Check for conflicts
-    overlapping_reservations = Reservation.query.filter(
-        and_(
-            Reservation.vehicle_id == data['vehicle_id'],
-            Reservation.status == 'Potvrzena',
-            or_(
-                and_(Reservation.start_time <= start_time, Reservation.end_time > start_time),
-                and_(Reservation.start_time < end_time, Reservation.end_time >= end_time),
-                and_(Reservation.start_time >= start_time, Reservation.end_time <= end_time)
-            )
-        )
-    ).first()
-    
-    if overlapping_reservations:
+    # Check for conflicts against the database inside the transaction, the
+    # source of truth. The vehicle lock keeps concurrent bookings from
+    # passing the check together.
+    lock_vehicles(vehicle.id)
+    if has_conflict(vehicle.id, start_time, end_time):
         return jsonify({'error': 'Vehicle is already reserved for this time period'}), 409
     
     # Determine user_id (admins can create reservations for others)
     target_user_id = data.get('user_id', user.id)
-    if target_user_id != user.id and user.role.name != 'Administrator':
+    if target_user_id != user.id and not user.is_admin:
         return jsonify({'error': 'Cannot create reservation for another user'}), 403
     
     reservation = Reservation(
@@ -111,37 +125,259 @@ def create_reservation():
         destination=data['destination'],
         passenger_count=data.get('passenger_count', 1),
         user_notes=data.get('user_notes'),
-        admin_notes=data.get('admin_notes') if user.role.name == 'Administrator' else None
+        admin_notes=data.get('admin_notes') if user.is_admin else None
     )
     
     db.session.add(reservation)
+    refresh_reservation(reservation)
     db.session.commit()
+    reservation_index.update(reservation)
     return jsonify(reservation.to_dict()), 201
 
+@reservations_bp.route('/reservations/allocate', methods=['POST'])
+@login_required
+def allocate_reservation():
+    user = g.principal
+    data = request.get_json() or {}
+    
+    try:
+        # Naive like the stored times, which the ranking compares against in memory
+        start_time = naive_utc(datetime.fromisoformat(data['start_time'].replace('Z', '+00:00')))
+        end_time = naive_utc(datetime.fromisoformat(data['end_time'].replace('Z', '+00:00')))
+    except (ValueError, KeyError, AttributeError):
+        return jsonify({'error': 'Invalid datetime format'}), 400
+    
+    if start_time >= end_time:
+        return jsonify({'error': 'End time must be after start time'}), 400
+    
+    if start_time < datetime.now():
+        return jsonify({'error': 'Cannot create reservation in the past'}), 400
+    
+    missing = [field for field in ('purpose', 'destination') if field not in data]
+    if missing:
+        return jsonify({'error': f"Missing {', '.join(missing)}"}), 400
+    
+    target_user_id = data.get('user_id', user.id)
+    if target_user_id != user.id and not user.is_admin:
+        return jsonify({'error': 'Cannot create reservation for another user'}), 403
+    
+    passenger_count = parse_passenger_count(data.get('passenger_count', 1))
+    if passenger_count is None:
+        return jsonify({'error': 'passenger_count must be a positive integer'}), 400
+    
+    for attempt in range(ALLOCATION_ATTEMPTS):
+        ranked = rank_vehicles(start_time, end_time, passenger_count,
+                               data.get('fuel_type'), data.get('transmission'))
+        if not ranked:
+            return jsonify({'error': 'No suitable vehicle is available for this time period'}), 409
+        vehicle, allocation = ranked[0]
+        
+        # Ranking read the schedule unlocked; confirm the pick under the lock
+        lock_vehicles(vehicle.id)
+        if has_conflict(vehicle.id, start_time, end_time):
+            # Ends the transaction, so no lock is held while re-ranking
+            db.session.rollback()
+            continue
+        
+        reservation = Reservation(
+            user_id=target_user_id,
+            vehicle_id=vehicle.id,
+            start_time=start_time,
+            end_time=end_time,
+            purpose=data['purpose'],
+            destination=data['destination'],
+            passenger_count=passenger_count,
+            user_notes=data.get('user_notes'),
+            admin_notes=data.get('admin_notes') if user.is_admin else None
+        )
+        db.session.add(reservation)
+        refresh_reservation(reservation)
+        db.session.commit()
+        reservation_index.update(reservation)
+        result = reservation.to_dict()
+        result['allocation'] = allocation
+        return jsonify(result), 201
+    
+    return jsonify({'error': 'Vehicles were booked concurrently; please try again'}), 409
+
+@reservations_bp.route('/reservations/bulk', methods=['POST'])
+@login_required
+def create_reservations_bulk():
+    user = g.principal
+    data = request.get_json() or {}
+    specs = data.get('reservations')
+    # atomic: create nothing unless every booking can be created
+    atomic = bool(data.get('atomic', False))
+    
+    if not isinstance(specs, list) or not specs:
+        return jsonify({'error': 'reservations must be a non-empty list'}), 400
+    
+    # Expand every entry, and its recurrence rule if any, into single bookings
+    bookings = []
+    for request_index, spec in enumerate(specs):
+        try:
+            # Naive like the stored times, as the batch is checked in memory
+            start_time = naive_utc(datetime.fromisoformat(spec['start_time'].replace('Z', '+00:00')))
+            end_time = naive_utc(datetime.fromisoformat(spec['end_time'].replace('Z', '+00:00')))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return jsonify({'error': f'Invalid datetime format in reservation {request_index}'}), 400
+        
+        if start_time >= end_time:
+            return jsonify({'error': f'End time must be after start time in reservation {request_index}'}), 400
+        
+        missing = [field for field in ('vehicle_id', 'purpose', 'destination') if field not in spec]
+        if missing:
+            return jsonify({'error': f"Missing {', '.join(missing)} in reservation {request_index}"}), 400
+        
+        try:
+            vehicle_id = int(spec['vehicle_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': f'vehicle_id must be an integer in reservation {request_index}'}), 400
+        
+        target_user_id = spec.get('user_id', user.id)
+        if target_user_id != user.id and not user.is_admin:
+            return jsonify({'error': 'Cannot create reservation for another user'}), 403
+        
+        passenger_count = parse_passenger_count(spec.get('passenger_count', 1))
+        if passenger_count is None:
+            return jsonify({'error': f'passenger_count must be a positive integer in reservation {request_index}'}), 400
+        
+        recurrence = spec.get('recurrence')
+        if recurrence and not isinstance(recurrence, str):
+            return jsonify({'error': f'recurrence must be an RRULE string in reservation {request_index}'}), 400
+        if recurrence:
+            occurrences = iter_occurrences(recurrence, start_time, end_time)
+        else:
+            occurrences = iter([(start_time, end_time)])
+        
+        # Expanded lazily, so the cap stops a request before it builds an oversized batch
+        try:
+            for occurrence, (occurrence_start, occurrence_end) in enumerate(occurrences):
+                if len(bookings) == BULK_MAX_BOOKINGS:
+                    return jsonify({'error': f'At most {BULK_MAX_BOOKINGS} bookings per request'}), 400
+                bookings.append({
+                    'request_index': request_index,
+                    'occurrence': occurrence,
+                    'spec': spec,
+                    'user_id': target_user_id,
+                    'passenger_count': passenger_count,
+                    'vehicle_id': vehicle_id,
+                    'start_time': occurrence_start,
+                    'end_time': occurrence_end
+                })
+        except InvalidRecurrence as e:
+            return jsonify({'error': f'Invalid recurrence in reservation {request_index}: {e}'}), 400
+    
+    vehicle_ids = {booking['vehicle_id'] for booking in bookings}
+    vehicles = {vehicle.id: vehicle for vehicle in Vehicle.query.filter(Vehicle.id.in_(vehicle_ids))}
+    now = datetime.now()
+    
+    results = []
+    candidates = []
+    for position, booking in enumerate(bookings):
+        vehicle = vehicles.get(booking['vehicle_id'])
+        result = {
+            'request_index': booking['request_index'],
+            'occurrence': booking['occurrence'],
+            'vehicle_id': booking['vehicle_id'],
+            'start_time': booking['start_time'].isoformat(),
+            'end_time': booking['end_time'].isoformat()
+        }
+        if not vehicle:
+            result.update(status='invalid', error='Vehicle not found')
+        elif vehicle.is_archived or vehicle.status != 'Aktivni':
+            result.update(status='invalid', error='Vehicle is not available for reservation')
+        elif booking['start_time'] < now:
+            result.update(status='invalid', error='Cannot create reservation in the past')
+        else:
+            candidates.append((position, booking, result))
+        results.append(result)
+    
+    # One conflict pass over the whole batch, against the database and itself
+    lock_vehicles(*[booking['vehicle_id'] for position, booking, result in candidates])
+    conflicts = find_batch_conflicts([(booking['vehicle_id'], booking['start_time'], booking['end_time'])
+                                      for position, booking, result in candidates])
+    free = []
+    for (position, booking, result), conflict in zip(candidates, conflicts):
+        if conflict is None:
+            free.append((booking, result))
+        elif 'reservations' in conflict:
+            result.update(status='conflict', conflicts_with=conflict['reservations'])
+        else:
+            result.update(status='conflict', conflicts_with_booking=candidates[conflict['booking']][0])
+    
+    if atomic and len(free) < len(results):
+        db.session.rollback()
+        for booking, result in free:
+            result['status'] = 'skipped'
+        return jsonify({'created': 0, 'results': results}), 409
+    
+    reservations = []
+    for booking, result in free:
+        spec = booking['spec']
+        reservations.append(Reservation(
+            user_id=booking['user_id'],
+            vehicle_id=booking['vehicle_id'],
+            start_time=booking['start_time'],
+            end_time=booking['end_time'],
+            purpose=spec['purpose'],
+            destination=spec['destination'],
+            passenger_count=booking['passenger_count'],
+            user_notes=spec.get('user_notes'),
+            admin_notes=spec.get('admin_notes') if user.is_admin else None
+        ))
+    
+    if reservations:
+        # On PostgreSQL the flush sends all rows as one multi-row INSERT ... RETURNING
+        db.session.add_all(reservations)
+        db.session.flush()
+        # Rollup days refreshed once per vehicle: its bookings' days and
+        # today, the day they were created
+        created_day = datetime.utcnow().date()
+        spans = {}
+        for reservation in reservations:
+            spans.setdefault(reservation.vehicle_id, []).append(
+                reservation_days(reservation.start_time, reservation.end_time))
+        for vehicle_id, booking_spans in spans.items():
+            refresh_bookings(vehicle_id, booking_spans, [created_day])
+        ids = [reservation.id for reservation in reservations]
+        db.session.commit()
+        
+        # One query reloads the committed rows for the response and the index
+        created = {item['id']: item for item in serialize_all(
+            Reservation.query.filter(Reservation.id.in_(ids)), 'reservation')}
+        for reservation_id, reservation, (booking, result) in zip(ids, reservations, free):
+            reservation_index.update(reservation)
+            result.update(status='created', reservation=created[reservation_id])
+    
+    return jsonify({'created': len(reservations), 'results': results}), 201 if reservations else 409
+
 @reservations_bp.route('/reservations/<int:reservation_id>', methods=['PUT'])
 @login_required
 def update_reservation(reservation_id):
-    user = User.query.get(session['user_id'])
+    user = g.principal
     reservation = Reservation.query.get_or_404(reservation_id)
     data = request.get_json()
     
     # Check permissions
-    if user.role.name != 'Administrator' and reservation.user_id != user.id:
+    if not user.is_admin and reservation.user_id != user.id:
         return jsonify({'error': 'Access denied'}), 403
     
     # Check time restrictions for non-admin users
-    if user.role.name != 'Administrator':
+    if not user.is_admin:
         time_until_start = reservation.start_time - datetime.now()
         if time_until_start < timedelta(hours=2):
             return jsonify({'error': 'Cannot modify reservation less than 2 hours before start time'}), 400
     
+    previous_span = reservation_days(reservation.start_time, reservation.end_time)
+    
     # Update basic fields
     for field in ['purpose', 'destination', 'passenger_count', 'user_notes']:
         if field in data:
             setattr(reservation, field, data[field])
     
     # Admin-only fields
-    if user.role.name == 'Administrator':
+    if user.is_admin:
         if 'admin_notes' in data:
             reservation.admin_notes = data['admin_notes']
         if 'status' in data:
@@ -164,53 +400,48 @@ def update_reservation(reservation_id):
             return jsonify({'error': 'Cannot set reservation start time in the past'}), 400
         
         # Check for conflicts (excluding current reservation)
-        overlapping_reservations = Reservation.query.filter(
-            and_(
-                Reservation.vehicle_id == reservation.vehicle_id,
-                Reservation.id != reservation.id,
-                Reservation.status == 'Potvrzena',
-                or_(
-                    and_(Reservation.start_time <= start_time, Reservation.end_time > start_time),
-                    and_(Reservation.start_time < end_time, Reservation.end_time >= end_time),
-                    and_(Reservation.start_time >= start_time, Reservation.end_time <= end_time)
-                )
-            )
-        ).first()
-        
-        if overlapping_reservations:
+        lock_vehicles(reservation.vehicle_id)
+        if has_conflict(reservation.vehicle_id, start_time, end_time, exclude_id=reservation.id):
+            db.session.rollback()
             return jsonify({'error': 'Vehicle is already reserved for this time period'}), 409
         
         reservation.start_time = start_time
         reservation.end_time = end_time
     
+    refresh_reservation(reservation, previous_span)
     db.session.commit()
+    reservation_index.update(reservation)
     return jsonify(reservation.to_dict())
 
 @reservations_bp.route('/reservations/<int:reservation_id>/cancel', methods=['PUT'])
 @login_required
 def cancel_reservation(reservation_id):
-    user = User.query.get(session['user_id'])
+    user = g.principal
     reservation = Reservation.query.get_or_404(reservation_id)
     
     # Check permissions
-    if user.role.name != 'Administrator' and reservation.user_id != user.id:
+    if not user.is_admin and reservation.user_id != user.id:
         return jsonify({'error': 'Access denied'}), 403
     
     # Check time restrictions for non-admin users
-    if user.role.name != 'Administrator':
+    if not user.is_admin:
         time_until_start = reservation.start_time - datetime.now()
         if time_until_start < timedelta(hours=2):
             return jsonify({'error': 'Cannot cancel reservation less than 2 hours before start time'}), 400
     
     reservation.status = 'Zrusena'
+    refresh_reservation(reservation)
     db.session.commit()
+    reservation_index.update(reservation)
     return jsonify(reservation.to_dict())
 
 @reservations_bp.route('/reservations/calendar', methods=['GET'])
 @login_required
+@read_replica()
 def get_calendar_reservations():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    compact = request.args.get('format') == 'compact'
     
     if not start_date or not end_date:
         return jsonify({'error': 'start_date and end_date parameters are required'}), 400
@@ -221,14 +452,45 @@ def get_calendar_reservations():
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
     
-    # Get all confirmed reservations in the date range
-    reservations = Reservation.query.filter(
-        and_(
-            Reservation.status == 'Potvrzena',
-            Reservation.start_time >= start_dt,
-            Reservation.start_time < end_dt
-        )
-    ).all()
+    # Confirmed and completed reservations overlapping the window, including
+    # those that start before it and run into it
+    in_window = occupying_filter(start_dt, end_dt)
+    
+    # The window's version: unchanged rows, count and vehicles mean an unchanged payload
+    count, reservations_changed, vehicles_changed = db.session.query(
+        func.count(Reservation.id), func.max(Reservation.updated_at), func.max(Vehicle.updated_at)
+    ).join(Vehicle, Reservation.vehicle_id == Vehicle.id).filter(in_window).one()
+    etag = make_etag('calendar', 'compact' if compact else 'full', start_dt, end_dt,
+                     count, reservations_changed, vehicles_changed)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    if compact:
+        rows = db.session.query(
+            Reservation.vehicle_id, Reservation.start_time, Reservation.end_time,
+            Reservation.id, Reservation.user_id,
+            Vehicle.make, Vehicle.model, Vehicle.license_plate
+        ).join(Vehicle, Reservation.vehicle_id == Vehicle.id).filter(in_window) \
+            .order_by(Reservation.vehicle_id, Reservation.start_time, Reservation.id).all()
+        
+        vehicles = []
+        timelines = {}
+        for vehicle_id, start_time, end_time, reservation_id, user_id, make, model, license_plate in rows:
+            if vehicle_id not in timelines:
+                vehicles.append({'id': vehicle_id, 'make': make, 'model': model, 'license_plate': license_plate})
+                timelines[vehicle_id] = []
+            timelines[vehicle_id].append([start_time.isoformat(), end_time.isoformat(), reservation_id, user_id])
+        
+        payload = {
+            'start': start_dt.isoformat(),
+            'end': end_dt.isoformat(),
+            'columns': ['start', 'end', 'reservation_id', 'user_id'],
+            'vehicles': vehicles,
+            'timelines': {str(vehicle_id): timeline for vehicle_id, timeline in timelines.items()}
+        }
+    else:
+        payload = serialize_all(Reservation.query.filter(in_window)
+                                .order_by(Reservation.start_time, Reservation.id), 'reservation')
     
-    return jsonify([reservation.to_dict() for reservation in reservations])
-
+    return with_validator(jsonify(payload), etag)
@@ -1,12 +1,16 @@
 from flask import Blueprint, request, jsonify
 from src.models.models import ServiceRecord, Vehicle, db
 from src.routes.auth import admin_required
+from src.services.pagination import paginated_response
+from src.services.rollup import refresh_record
+from src.services.replica import read_replica
 from datetime import datetime
 
 service_records_bp = Blueprint('service_records', __name__)
 
 @service_records_bp.route('/service-records', methods=['GET'])
 @admin_required
+@read_replica()
 def get_service_records():
     # Get query parameters for filtering
     vehicle_id = request.args.get('vehicle_id', type=int)
@@ -17,8 +21,7 @@ def get_service_records():
     if vehicle_id:
         query = query.filter(ServiceRecord.vehicle_id == vehicle_id)
     
-    service_records = query.order_by(ServiceRecord.service_date.desc()).all()
-    return jsonify([record.to_dict() for record in service_records])
+    return paginated_response(query, [(ServiceRecord.service_date, True), (ServiceRecord.id, True)], 'service_record')
 
 @service_records_bp.route('/service-records/<int:record_id>', methods=['GET'])
 @admin_required
@@ -57,6 +60,7 @@ def create_service_record():
     if not vehicle.last_service_date or service_date > vehicle.last_service_date:
         vehicle.last_service_date = service_date
     
+    refresh_record(record.vehicle_id, service_date)
     db.session.commit()
     return jsonify(record.to_dict()), 201
 
@@ -65,6 +69,7 @@ def create_service_record():
 def update_service_record(record_id):
     record = ServiceRecord.query.get_or_404(record_id)
     data = request.get_json()
+    previous_date = record.service_date
     
     # Update basic fields
     for field in ['service_type', 'description', 'cost', 'service_provider']:
@@ -85,6 +90,7 @@ def update_service_record(record_id):
         except ValueError:
             return jsonify({'error': 'Invalid date format'}), 400
     
+    refresh_record(record.vehicle_id, previous_date, record.service_date)
     db.session.commit()
     return jsonify(record.to_dict())
 
@@ -100,6 +106,7 @@ def delete_service_record(record_id):
     latest_service = ServiceRecord.query.filter_by(vehicle_id=vehicle.id).order_by(ServiceRecord.service_date.desc()).first()
     vehicle.last_service_date = latest_service.service_date if latest_service else None
     
+    refresh_record(vehicle.id, record.service_date)
     db.session.commit()
     return '', 204
 
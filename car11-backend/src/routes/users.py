@@ -1,11 +1,16 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, g
 from src.models.models import User, Role, db
 from src.routes.auth import login_required, admin_required
+from src.services.pagination import paginated_response
+from src.services.principal import forget_principal
+from src.services.tokens import revoke_user_tokens, tokens_enabled
+from src.services.versions import versioned
 
 users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/users', methods=['GET'])
 @admin_required
+@versioned('users', 'roles')  # role_name is part of every user
 def get_users():
     # Get query parameters for filtering
     status = request.args.get('status')  # active/inactive
@@ -22,16 +27,15 @@ def get_users():
     if role_id:
         query = query.filter(User.role_id == role_id)
     
-    users = query.all()
-    return jsonify([user.to_dict() for user in users])
+    return paginated_response(query, [(User.id, False)], 'user')
 
 @users_bp.route('/users/<int:user_id>', methods=['GET'])
 @login_required
 def get_user(user_id):
-    current_user = User.query.get(session['user_id'])
+    current_user = g.principal
     
     # Users can only view their own profile, admins can view any
-    if current_user.role.name != 'Administrator' and current_user.id != user_id:
+    if not current_user.is_admin and current_user.id != user_id:
         return jsonify({'error': 'Access denied'}), 403
     
     user = User.query.get_or_404(user_id)
@@ -81,12 +85,12 @@ def create_user():
 @users_bp.route('/users/<int:user_id>', methods=['PUT'])
 @login_required
 def update_user(user_id):
-    current_user = User.query.get(session['user_id'])
+    current_user = g.principal
     user = User.query.get_or_404(user_id)
     data = request.get_json()
     
     # Check permissions
-    is_admin = current_user.role.name == 'Administrator'
+    is_admin = current_user.is_admin
     is_own_profile = current_user.id == user_id
     
     if not is_admin and not is_own_profile:
@@ -133,7 +137,11 @@ def update_user(user_id):
         if 'password' in data:
             user.set_password(data['password'])
     
+    revoke_tokens = tokens_enabled() and any(field in data for field in ('role_id', 'is_active', 'password'))
     db.session.commit()
+    forget_principal(user_id)
+    if revoke_tokens:
+        revoke_user_tokens(user_id)
     return jsonify(user.to_dict())
 
 @users_bp.route('/users/<int:user_id>/deactivate', methods=['PUT'])
@@ -142,6 +150,9 @@ def deactivate_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_active = False
     db.session.commit()
+    forget_principal(user_id)
+    if tokens_enabled():
+        revoke_user_tokens(user_id)
     return jsonify(user.to_dict())
 
 @users_bp.route('/users/<int:user_id>/activate', methods=['PUT'])
@@ -150,10 +161,12 @@ def activate_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_active = True
     db.session.commit()
+    forget_principal(user_id)
     return jsonify(user.to_dict())
 
 @users_bp.route('/roles', methods=['GET'])
 @admin_required
+@versioned('roles')
 def get_roles():
     roles = Role.query.all()
     return jsonify([role.to_dict() for role in roles])
@@ -189,11 +202,16 @@ def update_role(role_id):
         if existing_role:
             return jsonify({'error': 'Role with this name already exists'}), 400
     
+    renamed = 'name' in data and data['name'] != role.name
     for field in ['name', 'description']:
         if field in data:
             setattr(role, field, data[field])
     
     db.session.commit()
+    forget_principal()
+    if renamed and tokens_enabled():
+        # Access tokens carry the role name
+        revoke_user_tokens(*[user_id for user_id, in db.session.query(User.id).filter(User.role_id == role_id)])
     return jsonify(role.to_dict())
 
 @users_bp.route('/roles/<int:role_id>', methods=['DELETE'])
@@ -208,5 +226,6 @@ def delete_role(role_id):
     
     db.session.delete(role)
     db.session.commit()
+    forget_principal()
     return '', 204
 
@@ -1,13 +1,20 @@
 from flask import Blueprint, request, jsonify
-from src.models.models import Vehicle, db, Reservation
+from src.models.models import Vehicle, VehicleAlert, db, Reservation
 from src.routes.auth import login_required, admin_required
-from datetime import datetime, date
-from sqlalchemy import and_, or_
+from src.services.availability import reservation_index, overlap_filter
+from src.services.serialization import serialize_all
+from src.services.pagination import paginated_response
+from src.services.versions import versioned
+from src.services.optimizer import plan, apply, StalePlan, DEFAULT_HORIZON_DAYS
+from datetime import datetime, date, timedelta
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import joinedload
 
 vehicles_bp = Blueprint('vehicles', __name__)
 
 @vehicles_bp.route('/vehicles', methods=['GET'])
 @login_required
+@versioned('vehicles')
 def get_vehicles():
     # Get query parameters for filtering
     status = request.args.get('status')
@@ -30,9 +37,111 @@ def get_vehicles():
     if transmission:
         query = query.filter(Vehicle.transmission == transmission)
     
+    return paginated_response(query, [(Vehicle.id, False)])
+
+@vehicles_bp.route('/vehicles/available', methods=['GET'])
+@login_required
+def get_available_vehicles():
+    start_time_str = request.args.get('start_time')
+    end_time_str = request.args.get('end_time')
+    seats = request.args.get('seats', type=int)
+    fuel_type = request.args.get('fuel_type')
+    transmission = request.args.get('transmission')
+    
+    if not start_time_str or not end_time_str:
+        return jsonify({'error': 'start_time and end_time parameters are required'}), 400
+    
+    try:
+        start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
+        end_time = datetime.fromisoformat(end_time_str.replace('Z', '+00:00'))
+    except ValueError:
+        return jsonify({'error': 'Invalid datetime format'}), 400
+    
+    if start_time >= end_time:
+        return jsonify({'error': 'End time must be after start time'}), 400
+    
+    # Whole fleet in one query: bookable vehicles with no overlapping confirmed reservation
+    conflicting = Reservation.query.filter(
+        Reservation.vehicle_id == Vehicle.id,
+        overlap_filter(start_time, end_time)
+    ).exists()
+    
+    query = Vehicle.query.filter(
+        Vehicle.is_archived == False,
+        Vehicle.status == 'Aktivni',
+        ~conflicting
+    )
+    
+    # Same filters as the vehicle list
+    if seats:
+        query = query.filter(Vehicle.seating_capacity >= seats)
+    
+    if fuel_type:
+        query = query.filter(Vehicle.fuel_type == fuel_type)
+    
+    if transmission:
+        query = query.filter(Vehicle.transmission == transmission)
+    
+    # Rank by fit: fewest spare seats first, then the least worn vehicle
+    if seats:
+        query = query.order_by(Vehicle.seating_capacity - seats)
+    query = query.order_by(func.coalesce(Vehicle.odometer, 0), Vehicle.id)
+    
     vehicles = query.all()
     return jsonify([vehicle.to_dict() for vehicle in vehicles])
 
+@vehicles_bp.route('/vehicles/optimize', methods=['POST'])
+@admin_required
+def optimize_vehicles():
+    # Without apply this is a dry run listing the moves and their plan_id.
+    # apply writes exactly the reviewed moves sent back with that plan_id,
+    # or nothing when the bookings changed since.
+    data = request.get_json() or {}
+    if data.get('apply'):
+        if not data.get('plan_id') or not isinstance(data.get('moves'), list):
+            return jsonify({'error': 'apply needs the plan_id and moves of a reviewed plan'}), 400
+        try:
+            reassigned = apply(data['moves'], data['plan_id'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except StalePlan as e:
+            return jsonify({'error': f'{e}; plan again from the current bookings'}), 409
+        return jsonify({'plan_id': data['plan_id'], 'moves': data['moves'],
+                        'reassigned': reassigned, 'applied': True})
+    
+    try:
+        start_date = date.fromisoformat(data['start_date']) if data.get('start_date') else date.today()
+        end_date = (date.fromisoformat(data['end_date']) if data.get('end_date')
+                    else start_date + timedelta(days=DEFAULT_HORIZON_DAYS - 1))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    if end_date < start_date:
+        return jsonify({'error': 'End date must not be before start date'}), 400
+    
+    try:
+        result = plan(start_date, end_date, data.get('goal', 'balance'), data.get('vehicle_ids') or [])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result['applied'] = False
+    return jsonify(result)
+
+@vehicles_bp.route('/vehicles/alerts', methods=['GET'])
+@admin_required
+def get_vehicle_alerts():
+    # Open expiry alerts maintained by the vehicle_expiry_alerts job
+    alerts = VehicleAlert.query.filter(VehicleAlert.resolved_at.is_(None)).options(
+        joinedload(VehicleAlert.vehicle)
+    ).order_by(VehicleAlert.due_date, VehicleAlert.id).all()
+    today = date.today()
+    result = []
+    for alert in alerts:
+        data = alert.to_dict()
+        data['expired'] = alert.due_date < today
+        result.append(data)
+    return jsonify(result)
+
 @vehicles_bp.route('/vehicles/<int:vehicle_id>', methods=['GET'])
 @login_required
 def get_vehicle(vehicle_id):
@@ -137,23 +246,17 @@ def check_vehicle_availability(vehicle_id):
     except ValueError:
         return jsonify({'error': 'Invalid datetime format'}), 400
     
-    # Check for overlapping reservations
-    overlapping_reservations = Reservation.query.filter(
-        and_(
-            Reservation.vehicle_id == vehicle_id,
-            Reservation.status == 'Potvrzena',
-            or_(
-                and_(Reservation.start_time <= start_time, Reservation.end_time > start_time),
-                and_(Reservation.start_time < end_time, Reservation.end_time >= end_time),
-                and_(Reservation.start_time >= start_time, Reservation.end_time <= end_time)
-            )
-        )
-    ).all()
+    # Check for overlapping reservations using the in-memory interval index;
+    # rows are only loaded when there is something to report
+    conflicting_ids = reservation_index.conflicts(vehicle_id, start_time, end_time)
+    overlapping_reservations = serialize_all(Reservation.query.filter(
+        Reservation.id.in_(conflicting_ids)
+    ).order_by(Reservation.start_time), 'reservation') if conflicting_ids else []
     
     is_available = len(overlapping_reservations) == 0 and not vehicle.is_archived and vehicle.status == 'Aktivni'
     
     return jsonify({
         'available': is_available,
-        'conflicting_reservations': [res.to_dict() for res in overlapping_reservations]
+        'conflicting_reservations': overlapping_reservations
     })
 
@@ -0,0 +1,89 @@
+from datetime import timedelta
+from src.models.models import db, Vehicle, Reservation
+from src.services.availability import overlap_filter
+
+# Best-fit vehicle allocation for "any suitable car" bookings. Every vehicle
+# that meets the requirements and is free for the window gets a score in
+# hours; the lowest score wins.
+#
+# - Fragmentation: the idle time left before and after the booking, up to
+#   LOOKAROUND per side. Filling a tight gap scores low, while an empty
+#   calendar scores high and stays free for long trips. Leftover gaps too
+#   short to book again count as MIN_USEFUL_GAP extra.
+# - Seats: SEAT_WEIGHT per seat beyond the passenger count.
+# - Wear: up to WEAR_WEIGHT for the highest odometer among the candidates.
+
+LOOKAROUND = timedelta(days=3)
+MIN_USEFUL_GAP = timedelta(hours=2)
+SEAT_WEIGHT = 4.0
+WEAR_WEIGHT = 24.0
+
+
+def _hours(delta):
+    return delta.total_seconds() / 3600
+
+
+def _gap_cost(gap):
+    gap = min(gap, LOOKAROUND)
+    cost = _hours(gap)
+    if timedelta(0) < gap < MIN_USEFUL_GAP:
+        cost += _hours(MIN_USEFUL_GAP)
+    return cost
+
+
+def rank_vehicles(start_time, end_time, passenger_count=1, fuel_type=None, transmission=None):
+    """Suitable vehicles free for the window, best fit first.
+
+    Returns (vehicle, details) pairs, details holding the score and its
+    parts. Costs two queries: the candidates, then their confirmed bookings
+    around the window in one pass ordered by vehicle and start time.
+    """
+    query = Vehicle.query.filter(
+        Vehicle.is_archived == False,
+        Vehicle.status == 'Aktivni',
+        Vehicle.seating_capacity >= passenger_count
+    )
+    if fuel_type:
+        query = query.filter(Vehicle.fuel_type == fuel_type)
+    if transmission:
+        query = query.filter(Vehicle.transmission == transmission)
+    vehicles = {vehicle.id: vehicle for vehicle in query}
+    if not vehicles:
+        return []
+
+    # Gaps default to an open calendar on both sides
+    gaps = {vehicle_id: [LOOKAROUND, LOOKAROUND] for vehicle_id in vehicles}
+    bookings = db.session.query(Reservation.vehicle_id, Reservation.start_time, Reservation.end_time).filter(
+        Reservation.vehicle_id.in_(vehicles),
+        overlap_filter(start_time - LOOKAROUND, end_time + LOOKAROUND)
+    ).order_by(Reservation.vehicle_id, Reservation.start_time)
+    for vehicle_id, booked_start, booked_end in bookings:
+        vehicle_gaps = gaps.get(vehicle_id)
+        if vehicle_gaps is None:
+            continue
+        if booked_start < end_time and booked_end > start_time:
+            del gaps[vehicle_id]
+        elif booked_end <= start_time:
+            vehicle_gaps[0] = min(vehicle_gaps[0], start_time - booked_end)
+        else:
+            vehicle_gaps[1] = min(vehicle_gaps[1], booked_start - end_time)
+
+    odometers = [vehicles[vehicle_id].odometer or 0 for vehicle_id in gaps]
+    low, high = (min(odometers), max(odometers)) if odometers else (0, 0)
+
+    ranked = []
+    for vehicle_id, (gap_before, gap_after) in gaps.items():
+        vehicle = vehicles[vehicle_id]
+        spare_seats = vehicle.seating_capacity - passenger_count
+        wear = ((vehicle.odometer or 0) - low) / (high - low) if high > low else 0.0
+        fragmentation = _gap_cost(gap_before) + _gap_cost(gap_after)
+        score = fragmentation + SEAT_WEIGHT * spare_seats + WEAR_WEIGHT * wear
+        ranked.append((vehicle, {
+            'score': round(score, 2),
+            'gap_before_hours': round(_hours(min(gap_before, LOOKAROUND)), 2),
+            'gap_after_hours': round(_hours(min(gap_after, LOOKAROUND)), 2),
+            'spare_seats': spare_seats,
+            'wear': round(wear, 3)
+        }))
+    ranked.sort(key=lambda item: (item[1]['score'], item[0].id))
+    return ranked
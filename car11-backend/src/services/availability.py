@@ -0,0 +1,271 @@
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import aliased
+from src.models.models import Reservation, db
+
+# Interval index is re-synced from the database at most this often, so that
+# bookings written by other gunicorn workers become visible to this one.
+INDEX_SYNC_INTERVAL = timedelta(seconds=5)
+# updated_at is stamped at flush, not at commit, so a transaction open longer
+# than the sync overlap can commit rows the incremental sync never sees. A
+# full reload this often bounds how long such a row stays missing.
+INDEX_RELOAD_INTERVAL = timedelta(minutes=5)
+
+# Reservations that occupied or occupy their vehicle. The scheduler moves
+# finished bookings from Potvrzena to Dokoncena, so views of the past such as
+# the calendar and the utilization rollup must count both.
+OCCUPYING_STATUSES = ('Potvrzena', 'Dokoncena')
+
+# First key of the PostgreSQL advisory locks taken per vehicle while booking
+BOOKING_LOCK_NAMESPACE = 1101
+
+
+def overlap_filter(start_time, end_time):
+    """SQL condition for confirmed reservations overlapping [start_time, end_time)"""
+    return and_(
+        Reservation.status == 'Potvrzena',
+        Reservation.start_time < end_time,
+        Reservation.end_time > start_time
+    )
+
+
+def occupying_filter(start_time, end_time):
+    """SQL condition for confirmed or completed reservations overlapping [start_time, end_time)"""
+    return and_(
+        Reservation.status.in_(OCCUPYING_STATUSES),
+        Reservation.start_time < end_time,
+        Reservation.end_time > start_time
+    )
+
+
+def naive_utc(moment):
+    """Datetime comparable with the stored naive ones; aware values are converted to UTC"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def find_conflicts(vehicle_id, start_time, end_time, exclude_id=None):
+    """Query the database for confirmed reservations of a vehicle overlapping the period"""
+    query = Reservation.query.filter(
+        Reservation.vehicle_id == vehicle_id,
+        overlap_filter(start_time, end_time)
+    )
+    if exclude_id is not None:
+        query = query.filter(Reservation.id != exclude_id)
+    return query.all()
+
+
+def lock_vehicles(*vehicle_ids):
+    """Serialize bookings of the given vehicles until the transaction ends.
+
+    Call before checking for conflicts, so that check and insert are atomic
+    with respect to other bookings. PostgreSQL takes a transaction-scoped
+    advisory lock per vehicle, leaving bookings of other vehicles parallel.
+    SQLite has no finer lock than the database: the transaction becomes a
+    write transaction right away (BEGIN IMMEDIATE), which serializes all
+    bookings, as SQLite serializes all writes anyway.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        # Fixed order, so two multi-vehicle bookings cannot deadlock
+        for vehicle_id in sorted(set(vehicle_ids)):
+            connection.execute(text('SELECT pg_advisory_xact_lock(:namespace, :vehicle_id)'),
+                               {'namespace': BOOKING_LOCK_NAMESPACE, 'vehicle_id': vehicle_id})
+    elif connection.dialect.name == 'sqlite':
+        dbapi_connection = connection.connection.driver_connection
+        if not dbapi_connection.in_transaction:
+            dbapi_connection.execute('BEGIN IMMEDIATE')
+
+
+def find_double_bookings(vehicle_ids=None):
+    """Pairs of ids of confirmed reservations of one vehicle that overlap"""
+    other = aliased(Reservation)
+    query = db.session.query(Reservation.id, other.id).join(other, and_(
+        other.vehicle_id == Reservation.vehicle_id,
+        other.id > Reservation.id,
+        other.status == 'Potvrzena',
+        other.start_time < Reservation.end_time,
+        other.end_time > Reservation.start_time
+    )).filter(Reservation.status == 'Potvrzena')
+    if vehicle_ids is not None:
+        query = query.filter(Reservation.vehicle_id.in_(vehicle_ids))
+    return query.all()
+
+
+def has_conflict(vehicle_id, start_time, end_time, exclude_id=None):
+    """Check whether a booking would clash with a confirmed reservation.
+
+    Callers hold lock_vehicles() for the vehicle. The check always runs
+    against the database within the current transaction: the interval index
+    may lag behind bookings made by other workers, so it cannot settle it.
+    """
+    return bool(find_conflicts(vehicle_id, start_time, end_time, exclude_id=exclude_id))
+
+
+def find_batch_conflicts(bookings):
+    """Check a batch of bookings against confirmed reservations and each other.
+
+    bookings is a list of (vehicle_id, start_time, end_time). A single query
+    loads the confirmed reservations of every involved vehicle within that
+    vehicle's overall window; the overlap tests then run in memory. Returns
+    one entry per booking: None when it is free, else a dict naming the
+    clashing reservation ids or the index of the earlier booking it clashes
+    with. Clashing bookings do not block the ones after them.
+    """
+    windows = {}
+    for vehicle_id, start_time, end_time in bookings:
+        low, high = windows.get(vehicle_id, (start_time, end_time))
+        windows[vehicle_id] = (min(low, start_time), max(high, end_time))
+    if not windows:
+        return []
+
+    existing = {}
+    rows = db.session.query(
+        Reservation.id, Reservation.vehicle_id, Reservation.start_time, Reservation.end_time
+    ).filter(or_(*[
+        and_(Reservation.vehicle_id == vehicle_id, overlap_filter(low, high))
+        for vehicle_id, (low, high) in windows.items()
+    ])).all()
+    for reservation_id, vehicle_id, start_time, end_time in rows:
+        existing.setdefault(vehicle_id, _VehicleTimeline()).add(reservation_id, start_time, end_time)
+
+    accepted = {}
+    results = []
+    for position, (vehicle_id, start_time, end_time) in enumerate(bookings):
+        timeline = existing.get(vehicle_id)
+        clashing = timeline.overlapping(start_time, end_time) if timeline else []
+        if clashing:
+            results.append({'reservations': clashing})
+            continue
+        batch = accepted.setdefault(vehicle_id, _VehicleTimeline())
+        earlier = batch.overlapping(start_time, end_time)
+        if earlier:
+            results.append({'booking': min(earlier)})
+            continue
+        batch.add(position, start_time, end_time)
+        results.append(None)
+    return results
+
+
+class _VehicleTimeline:
+    """Confirmed reservations of one vehicle kept sorted by start time"""
+
+    def __init__(self):
+        self.starts = []
+        self.entries = []  # (start_time, end_time, reservation_id), same order as starts
+        self.max_duration = timedelta(0)
+
+    def add(self, reservation_id, start_time, end_time):
+        entry = (start_time, end_time, reservation_id)
+        position = bisect_right(self.entries, entry)
+        self.entries.insert(position, entry)
+        self.starts.insert(position, start_time)
+        self.max_duration = max(self.max_duration, end_time - start_time)
+
+    def remove(self, reservation_id, start_time, end_time):
+        entry = (start_time, end_time, reservation_id)
+        position = bisect_left(self.entries, entry)
+        if position < len(self.entries) and self.entries[position] == entry:
+            del self.entries[position]
+            del self.starts[position]
+
+    def overlapping(self, start_time, end_time):
+        # Any overlapping reservation starts before end_time and, being at most
+        # max_duration long, cannot start earlier than start_time - max_duration.
+        low = bisect_right(self.starts, start_time - self.max_duration)
+        high = bisect_left(self.starts, end_time)
+        return [entry[2] for entry in self.entries[low:high] if entry[1] > start_time]
+
+
+class ReservationIndex:
+    """Process-local per-vehicle interval index of confirmed reservations.
+
+    The index answers overlap questions in O(log n + k) per vehicle without
+    touching the database. It is loaded once at startup, updated by the
+    reservation endpoints after each commit and periodically re-synced from
+    rows whose updated_at changed, which covers writes made by other workers.
+    A full reload every INDEX_RELOAD_INTERVAL catches rows from long
+    transactions whose updated_at predates the incremental window.
+    The database remains the source of truth: booking endpoints re-validate
+    against it inside the transaction before committing.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._timelines = {}
+        self._known = {}  # reservation_id -> (vehicle_id, start_time, end_time)
+        self._synced_at = None
+        self._checked_at = None
+        self._loaded_at = None
+
+    def load(self):
+        """(Re)build the whole index from the database"""
+        synced_at = datetime.utcnow()
+        rows = db.session.query(
+            Reservation.id, Reservation.vehicle_id, Reservation.start_time, Reservation.end_time
+        ).filter(Reservation.status == 'Potvrzena').all()
+        with self._lock:
+            self._timelines = {}
+            self._known = {}
+            for reservation_id, vehicle_id, start_time, end_time in rows:
+                self._add(reservation_id, vehicle_id, start_time, end_time)
+            self._synced_at = self._loaded_at = synced_at
+            self._checked_at = datetime.utcnow()
+
+    def sync(self, force=False):
+        """Apply reservations changed since the last sync"""
+        now = datetime.utcnow()
+        with self._lock:
+            if self._synced_at is None or now - self._loaded_at >= INDEX_RELOAD_INTERVAL:
+                return self.load()
+            if not force and now - self._checked_at < INDEX_SYNC_INTERVAL:
+                return
+            # Small overlap with the previous window tolerates clock skew between workers
+            since = self._synced_at - INDEX_SYNC_INTERVAL
+            self._checked_at = now
+        rows = db.session.query(
+            Reservation.id, Reservation.vehicle_id, Reservation.start_time,
+            Reservation.end_time, Reservation.status
+        ).filter(Reservation.updated_at >= since).all()
+        with self._lock:
+            for row in rows:
+                self._apply(*row)
+            self._synced_at = now
+
+    def update(self, reservation):
+        """Reflect the committed state of a single reservation"""
+        with self._lock:
+            self._apply(reservation.id, reservation.vehicle_id, reservation.start_time,
+                        reservation.end_time, reservation.status)
+
+    def conflicts(self, vehicle_id, start_time, end_time, exclude_id=None):
+        """Ids of indexed confirmed reservations overlapping the period"""
+        start_time, end_time = naive_utc(start_time), naive_utc(end_time)
+        self.sync()
+        with self._lock:
+            timeline = self._timelines.get(vehicle_id)
+            if timeline is None:
+                return []
+            return [reservation_id for reservation_id in timeline.overlapping(start_time, end_time)
+                    if reservation_id != exclude_id]
+
+    def _apply(self, reservation_id, vehicle_id, start_time, end_time, status):
+        self._discard(reservation_id)
+        if status == 'Potvrzena':
+            self._add(reservation_id, vehicle_id, start_time, end_time)
+
+    def _add(self, reservation_id, vehicle_id, start_time, end_time):
+        self._timelines.setdefault(vehicle_id, _VehicleTimeline()).add(reservation_id, start_time, end_time)
+        self._known[reservation_id] = (vehicle_id, start_time, end_time)
+
+    def _discard(self, reservation_id):
+        known = self._known.pop(reservation_id, None)
+        if known is not None:
+            vehicle_id, start_time, end_time = known
+            self._timelines[vehicle_id].remove(reservation_id, start_time, end_time)
+
+
+reservation_index = ReservationIndex()
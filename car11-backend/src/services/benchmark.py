@@ -0,0 +1,372 @@
+import click
+import http.cookiejar
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime, timedelta
+from flask.cli import AppGroup, ScriptInfo
+from src.services.availability import find_double_bookings
+from src.services.seed import BENCH_ADMIN, BENCH_PASSWORD
+
+# Latency and query-count benchmark of the real application. Requests go
+# through the Flask test client, or over HTTP to a running server with --url.
+# Queries per request are read from the Server-Timing header, so both modes
+# measure the same thing. Run it against a database seeded with
+# `flask seed fleet`; the booking scenarios write reservations.
+
+benchmark_cli = AppGroup('benchmark', help='Measure endpoint latency and queries per request.')
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+                                'benchmarks', 'baseline.json')
+# Latency differences below this many milliseconds are treated as noise
+NOISE_FLOOR_MS = 5.0
+
+_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class _Response:
+    def __init__(self, status, body, headers):
+        self.status = status
+        self.body = body
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.body)
+
+    @property
+    def queries(self):
+        match = _QUERIES.search(', '.join(self.headers.get_all('Server-Timing') or []))
+        return int(match.group(1)) if match else None
+
+
+class _Headers:
+    def __init__(self, pairs):
+        self._pairs = list(pairs)
+
+    def get_all(self, name):
+        return [value for key, value in self._pairs if key.lower() == name.lower()]
+
+
+class TestClientDriver:
+    """Requests through app.test_client(), each in its own app context"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self._client.open(path, method=method, json=body)
+        return _Response(response.status_code, response.get_data(), _Headers(response.headers.items()))
+
+
+class HttpDriver:
+    """Requests to a running server, keeping its session cookie"""
+
+    def __init__(self, base_url):
+        self._base_url = base_url.rstrip('/')
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self._base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'} if data else {})
+        try:
+            with self._opener.open(request) as response:
+                return _Response(response.status, response.read(), _Headers(response.headers.items()))
+        except urllib.error.HTTPError as e:
+            return _Response(e.code, e.read(), _Headers(e.headers.items()))
+
+
+def _percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def _scenarios(driver, make_driver, iterations):
+    """(name, iterations, callable(i) -> response, expected status, cleanup) per benchmarked endpoint"""
+    vehicles = [vehicle for vehicle in driver.request('GET', '/api/vehicles?limit=1000').json()
+                if vehicle['status'] == 'Aktivni']
+    if not vehicles:
+        raise click.ClickException('No active vehicles; seed the database with `flask seed fleet` first')
+    today = date.today()
+    window = f'start_date={today - timedelta(days=90)}&end_date={today}'
+    week = f'start_date={today}&end_date={today + timedelta(days=7)}'
+    slot_start = datetime.now().replace(microsecond=0) + timedelta(days=30)
+    slot_end = slot_start + timedelta(hours=4)
+    # Bookings go far beyond the seeded horizon, one non-overlapping slot per iteration
+    booking_base = datetime.now().replace(second=0, microsecond=0) + timedelta(days=400)
+
+    def login(i):
+        return make_driver().request('POST', '/api/login',
+                                     {'username': BENCH_ADMIN, 'password': BENCH_PASSWORD})
+
+    def availability(i):
+        vehicle = vehicles[i % len(vehicles)]
+        return driver.request('GET', f"/api/vehicles/{vehicle['id']}/availability"
+                                     f"?start_time={slot_start.isoformat()}&end_time={slot_end.isoformat()}")
+
+    booked = []
+
+    def booking(i):
+        vehicle = vehicles[i % len(vehicles)]
+        start = booking_base + timedelta(hours=6 * i)
+        response = driver.request('POST', '/api/reservations', {
+            'vehicle_id': vehicle['id'],
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(hours=4)).isoformat(),
+            'purpose': 'Benchmark',
+            'destination': 'Praha'
+        })
+        if response.status == 201:
+            booked.append(response.json()['id'])
+        return response
+
+    def cancel_bookings():
+        # Frees the slots so the next run can book them again
+        for reservation_id in booked:
+            driver.request('PUT', f'/api/reservations/{reservation_id}/cancel')
+
+    def get(path):
+        return lambda i: driver.request('GET', path)
+
+    few = max(1, iterations // 5)
+    return [
+        ('login', few, login, 200, None),
+        ('availability', iterations, availability, 200, None),
+        ('fleet_availability', iterations,
+         get(f'/api/vehicles/available?start_time={slot_start.isoformat()}&end_time={slot_end.isoformat()}'), 200, None),
+        ('booking', iterations, booking, 201, cancel_bookings),
+        ('calendar_week', iterations, get(f'/api/reservations/calendar?{week}'), 200, None),
+        ('calendar_week_compact', iterations, get(f'/api/reservations/calendar?{week}&format=compact'), 200, None),
+        ('reservations', iterations, get('/api/reservations'), 200, None),
+        ('vehicles', iterations, get('/api/vehicles'), 200, None),
+        ('users', iterations, get('/api/users'), 200, None),
+        ('service_records', iterations, get('/api/service-records'), 200, None),
+        ('damage_records', iterations, get('/api/damage-records'), 200, None),
+        ('dashboard', iterations, get('/api/dashboard'), 200, None),
+        ('vehicle_utilization', iterations, get(f'/api/vehicle-utilization?{window}'), 200, None),
+        ('cost_analysis', iterations, get(f'/api/cost-analysis?{window}'), 200, None),
+        ('reservation_statistics', iterations, get(f'/api/reservation-statistics?{window}'), 200, None),
+        ('export_reservations', few, get(f'/api/export/reservations?{window}'), 200, None),
+    ]
+
+
+def run_benchmark(make_driver, iterations, only=None):
+    """Run every scenario and return {name: statistics}"""
+    driver = make_driver()
+    response = driver.request('POST', '/api/login', {'username': BENCH_ADMIN, 'password': BENCH_PASSWORD})
+    if response.status != 200:
+        raise click.ClickException(f'Cannot log in as {BENCH_ADMIN}; seed the database with `flask seed fleet`')
+
+    results = {}
+    for name, count, call, expected, cleanup in _scenarios(driver, make_driver, iterations):
+        if only and name not in only:
+            continue
+        call(0)  # warm-up
+        latencies, queries, errors = [], [], 0
+        for i in range(1, count + 1):
+            started = time.perf_counter()
+            response = call(i)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status != expected:
+                errors += 1
+            if response.queries is not None:
+                queries.append(response.queries)
+        if cleanup:
+            cleanup()
+        results[name] = {
+            'requests': count,
+            'errors': errors,
+            'p50_ms': round(_percentile(latencies, 0.50), 2),
+            'p95_ms': round(_percentile(latencies, 0.95), 2),
+            'p99_ms': round(_percentile(latencies, 0.99), 2),
+            'queries_avg': round(sum(queries) / len(queries), 2) if queries else None,
+            'queries_max': max(queries) if queries else None
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against a baseline, as human-readable strings"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if current['errors']:
+            regressions.append(f"{name}: {current['errors']} unexpected response status(es)")
+        if not previous:
+            continue
+        allowed = previous['p95_ms'] * (1 + tolerance)
+        if current['p95_ms'] > allowed and current['p95_ms'] - previous['p95_ms'] > NOISE_FLOOR_MS:
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms exceeds baseline {previous['p95_ms']}ms")
+        if (current['queries_max'] is not None and previous.get('queries_max') is not None
+                and current['queries_max'] > previous['queries_max']):
+            regressions.append(f"{name}: {current['queries_max']} queries per request, "
+                               f"baseline {previous['queries_max']}")
+    return regressions
+
+
+@benchmark_cli.command('run', with_appcontext=False)
+@click.option('--url', help='Benchmark a running server instead of the in-process test client.')
+@click.option('--iterations', default=50, show_default=True, help='Requests per scenario.')
+@click.option('--only', multiple=True, help='Run only these scenarios.')
+@click.option('--baseline', 'baseline_path', default=DEFAULT_BASELINE, show_default=True,
+              type=click.Path(dir_okay=False))
+@click.option('--save-baseline', is_flag=True, help='Store the results as the new baseline.')
+@click.option('--tolerance', default=0.5, show_default=True,
+              help='Allowed relative p95 increase over the baseline.')
+@click.pass_context
+def run_command(ctx, url, iterations, only, baseline_path, save_baseline, tolerance):
+    """Measure p50/p95/p99 latency and queries per request"""
+    if url:
+        make_driver = lambda: HttpDriver(url)
+    else:
+        # Outside an app context, so every request gets its own like in production
+        app = ctx.ensure_object(ScriptInfo).load_app()
+        make_driver = lambda: TestClientDriver(app)
+
+    results = run_benchmark(make_driver, iterations, set(only))
+
+    click.echo(f"{'scenario':24} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'errors':>6}")
+    for name, stats in results.items():
+        queries = '-' if stats['queries_max'] is None else stats['queries_max']
+        click.echo(f"{name:24} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f} "
+                   f"{queries:>8} {stats['errors']:6}")
+
+    if save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        click.echo(f'Baseline written to {baseline_path}')
+        return
+
+    if not os.path.exists(baseline_path):
+        click.echo('No baseline to compare with; run again with --save-baseline to store one')
+        return
+    with open(baseline_path) as f:
+        regressions = compare(results, json.load(f), tolerance)
+    for regression in regressions:
+        click.echo(f'REGRESSION {regression}')
+    if regressions:
+        raise click.ClickException(f'{len(regressions)} regression(s) against {baseline_path}')
+    click.echo('No regressions against the baseline')
+
+
+def _login(driver, attempts=10):
+    """Log a driver in as the bench admin, waiting out a busy password pool"""
+    for attempt in range(attempts):
+        response = driver.request('POST', '/api/login', {'username': BENCH_ADMIN, 'password': BENCH_PASSWORD})
+        if response.status != 503:
+            break
+        retry_after = response.headers.get_all('Retry-After')
+        time.sleep(float(retry_after[0]) if retry_after else 1.0)
+    if response.status != 200:
+        raise click.ClickException(f'Login as {BENCH_ADMIN} failed with HTTP {response.status}; '
+                                   'seed the database with `flask seed fleet` first')
+    return driver
+
+
+def booking_race(make_driver, clients, vehicle_count, slots, verify):
+    """Let clients book the same slots concurrently and return the outcome.
+
+    Every client tries every slot, shifted by up to an hour, so all attempts
+    at one slot overlap each other and at most one of them may succeed.
+    verify(vehicle_ids, created_ids) runs before the created bookings are
+    cancelled again; its result is returned as 'verified'.
+    """
+    driver = _login(make_driver())
+    vehicles = [vehicle['id'] for vehicle in driver.request('GET', '/api/vehicles?limit=1000').json()
+                if vehicle['status'] == 'Aktivni'][:vehicle_count]
+    if not vehicles:
+        raise click.ClickException('No active vehicles; seed the database with `flask seed fleet` first')
+    # Beyond the seeded horizon and the booking benchmark; slots 6 hours apart
+    base = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=800)
+    targets = [(vehicle_id, base + timedelta(hours=6 * slot)) for vehicle_id in vehicles for slot in range(slots)]
+
+    lock = threading.Lock()
+    statuses = {}
+    created = []
+    barrier = threading.Barrier(clients)
+    # Logged in one at a time up front: concurrent logins would be turned
+    # away by the password pool and leave clients out of the race
+    sessions = [_login(make_driver()) for number in range(clients)]
+
+    def client(number):
+        session = sessions[number]
+        rng = random.Random(number)
+        attempts = targets[:]
+        rng.shuffle(attempts)
+        barrier.wait()
+        for vehicle_id, start in attempts:
+            start += timedelta(minutes=rng.randint(-60, 60))
+            response = session.request('POST', '/api/reservations', {
+                'vehicle_id': vehicle_id,
+                'start_time': start.isoformat(),
+                'end_time': (start + timedelta(hours=4)).isoformat(),
+                'purpose': 'Booking race',
+                'destination': 'Praha'
+            })
+            with lock:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+                if response.status == 201:
+                    created.append(response.json()['id'])
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    try:
+        verified = verify(vehicles, created)
+    finally:
+        for reservation_id in created:
+            driver.request('PUT', f'/api/reservations/{reservation_id}/cancel')
+    return {'slots': len(targets), 'statuses': statuses, 'created': created,
+            'elapsed': elapsed, 'verified': verified}
+
+
+@benchmark_cli.command('booking-race', with_appcontext=False)
+@click.option('--url', help='Race against a running server; it must use the same database as this app.')
+@click.option('--clients', default=16, show_default=True, help='Concurrent clients.')
+@click.option('--vehicles', default=4, show_default=True, help='Contested vehicles.')
+@click.option('--slots', default=10, show_default=True, help='Contested slots per vehicle.')
+@click.pass_context
+def booking_race_command(ctx, url, clients, vehicles, slots):
+    """Book the same slots from many clients at once and check for double bookings"""
+    app = ctx.ensure_object(ScriptInfo).load_app()
+    make_driver = (lambda: HttpDriver(url)) if url else (lambda: TestClientDriver(app))
+
+    def verify(vehicle_ids, created):
+        # Checked in the database, while the created bookings are still confirmed
+        with app.app_context():
+            return [pair for pair in find_double_bookings(vehicle_ids) if set(pair) & set(created)]
+
+    result = booking_race(make_driver, clients, vehicles, slots, verify)
+
+    attempts = sum(result['statuses'].values())
+    click.echo(f"{attempts} booking attempts in {result['elapsed']:.2f}s "
+               f"({attempts / result['elapsed']:.0f}/s) for {result['slots']} contested slots")
+    for status, count in sorted(result['statuses'].items()):
+        click.echo(f'  HTTP {status}: {count}')
+
+    overlapping = result['verified']
+    problems = []
+    # Anything but booked or refused means some clients did not really race
+    unexpected = {status: count for status, count in result['statuses'].items() if status not in (201, 409)}
+    if unexpected:
+        problems.append('unexpected responses ' + ', '.join(f'HTTP {status} x{count}'
+                                                             for status, count in sorted(unexpected.items())))
+    if len(result['created']) > result['slots']:
+        problems.append(f"{len(result['created'])} bookings succeeded for {result['slots']} slots")
+    if overlapping:
+        problems.append(f'{len(overlapping)} double booking(s): {overlapping[:10]}')
+    if problems:
+        raise click.ClickException('; '.join(problems))
+    click.echo(f"No double bookings; {len(result['created'])} of {result['slots']} slots booked")
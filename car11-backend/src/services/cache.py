@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# (cache, model classes) pairs; a commit touching any of the models clears the cache
+_watchers = []
+
+
+class TTLCache:
+    """Small process-local cache whose entries expire after ttl seconds"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get_or_set(self, key, factory):
+        """Return the cached value for key, computing it with factory() when missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        value = factory()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LRUCache:
+    """Process-local cache holding at most maxsize entries, each valid for ttl seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return the cached value for key, or None when missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def invalidate_on_commit(cache, *models):
+    """Clear cache whenever a committed transaction wrote one of the models"""
+    _watchers.append((cache, models))
+
+
+def _touched(session):
+    return session.info.setdefault('touched_models', set())
+
+
+def mark_written(session, *models):
+    """Record models written by Core statements, which no session event sees"""
+    _touched(session).update(models)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flushed_models(session, flush_context):
+    touched = _touched(session)
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        touched.add(type(instance))
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _record_bulk_models(context):
+    _touched(context.session).add(context.mapper.class_)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_caches(session):
+    touched = session.info.pop('touched_models', None)
+    if not touched:
+        return
+    for cache, models in _watchers:
+        if any(issubclass(model, models) for model in touched):
+            cache.clear()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched_models(session):
+    session.info.pop('touched_models', None)
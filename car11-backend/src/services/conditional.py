@@ -0,0 +1,33 @@
+import hashlib
+from flask import request, make_response
+
+# Conditional GET helpers. A view derives a validator from cheap metadata
+# (row counts, change timestamps) and answers 304 when the client already
+# holds that version, before the row data is loaded at all.
+
+
+def make_etag(*parts):
+    """Strong entity tag for the given version components"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def not_modified(etag, last_modified=None):
+    """304 response if the client already holds this version, else None.
+
+    Only If-None-Match is checked. If-Modified-Since is ignored: an HTTP
+    date has whole-second precision, so two writes within one second would
+    look unchanged. last_modified is only sent back as a header.
+    """
+    if request.if_none_match and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        return with_validator(response, etag, last_modified)
+    return None
+
+
+def with_validator(response, etag, last_modified=None):
+    """Attach the validators and require revalidation before reuse"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
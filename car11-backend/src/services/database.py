@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+# Engine options sized from the gunicorn process model. Each gthread worker
+# needs at most one connection per thread, and all workers together must
+# stay below the connection limit of the database plan (or of pgbouncer).
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, str(default)).lower() == 'true'
+
+
+def events_backend():
+    """Backend of the live change feed: EVENTS_BACKEND, else derived from the deployment.
+
+    Several workers on PostgreSQL relay events through LISTEN/NOTIFY, so each
+    stream sees every worker's changes. LISTEN needs a session connection,
+    which pgbouncer in transaction mode does not provide.
+    """
+    configured = os.environ.get('EVENTS_BACKEND')
+    if configured:
+        return configured
+    database_url = os.environ.get('DATABASE_URL', '')
+    if (database_url.startswith('postgres') and _env_int('WEB_CONCURRENCY', 2) > 1
+            and not _env_flag('DB_PGBOUNCER', False)):
+        return 'postgres'
+    return 'local'
+
+
+class PoolStats:
+    """Time spent waiting for a pooled connection, across all checkouts of one pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_max': self.wait_max
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        # Per pool, so the primary and replica engines report separately
+        self.stats = PoolStats()
+        self.max_overflow = max_overflow
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(time.monotonic() - started, timed_out=True)
+            raise
+        self.stats.record(time.monotonic() - started)
+        return connection
+
+
+def engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database and process model"""
+    workers = _env_int('WEB_CONCURRENCY', 2)
+    threads = _env_int('GUNICORN_THREADS', 4)
+    max_connections = _env_int('DB_MAX_CONNECTIONS', 20)
+
+    options = {
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True),
+        # Render closes idle connections; recycle before that happens
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 280)
+    }
+
+    if database_url.startswith('postgresql') and _env_flag('DB_PGBOUNCER', False):
+        # pgbouncer in transaction mode owns the pooling, and a server
+        # connection may change between transactions, so statements must not
+        # be prepared server-side. psycopg2 never prepares; psycopg 3 would.
+        options['poolclass'] = NullPool
+        if database_url.startswith('postgresql+psycopg:'):
+            options['connect_args'] = {'prepare_threshold': None}
+        return options
+
+    per_worker = max(1, max_connections // max(1, workers))
+    if events_backend() == 'postgres':
+        # Each worker also holds one LISTEN connection outside the pool
+        per_worker = max(1, per_worker - 1)
+    pool_size = _env_int('DB_POOL_SIZE', min(threads, per_worker))
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', max(0, per_worker - pool_size)),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        # Reusing the most recent connection lets the surplus ones idle out
+        'pool_use_lifo': True
+    })
+    return options
+
+
+def pool_status(engine):
+    """Current occupancy of an engine's pool plus checkout wait statistics"""
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, TimedQueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(0, pool.overflow()),
+            'max_overflow': pool.max_overflow,
+            'timeout': pool.timeout()
+        })
+        status.update(pool.stats.snapshot())
+    return status
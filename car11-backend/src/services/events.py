@@ -0,0 +1,254 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from src.models.models import db, Reservation, Vehicle
+from src.services.database import events_backend
+
+# Live change feed served on /api/events. Committed transactions that create,
+# update or cancel reservations, or change a vehicle's status or archive
+# flag, publish compact deltas to every open event stream. With several
+# gunicorn workers on PostgreSQL the deltas travel through LISTEN/NOTIFY and
+# reach every worker (see database.events_backend). Otherwise the local
+# backend only reaches streams served by the writing process; when other
+# workers exist, streams are then told to resync every
+# EVENTS_RESYNC_INTERVAL seconds, so clients never drift for longer.
+
+logger = logging.getLogger(__name__)
+
+EVENTS_BACKEND = events_backend()
+NOTIFY_CHANNEL = 'car11_events'
+# Recent events kept per worker for clients resuming with Last-Event-ID
+EVENTS_HISTORY_SIZE = int(os.environ.get('EVENTS_HISTORY_SIZE', 1000))
+# Events a stream may fall behind by before it is told to resync
+SUBSCRIBER_QUEUE_SIZE = 256
+LISTEN_RETRY_INTERVAL = 5.0
+# Local backend with other workers: how often streams are told to resync
+EVENTS_RESYNC_INTERVAL = int(os.environ.get('EVENTS_RESYNC_INTERVAL', 60))
+
+RESYNC = 'resync'
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def make_event(event_type, data=None):
+    return {'id': uuid.uuid4().hex, 'type': event_type, 'data': data or {}}
+
+
+def resync_event():
+    """Tells a client it may have missed deltas and should refetch its state"""
+    return make_event(RESYNC)
+
+
+def reservation_event(action, reservation):
+    return make_event(f'reservation.{action}', {
+        'id': reservation.id,
+        'vehicle_id': reservation.vehicle_id,
+        'user_id': reservation.user_id,
+        'start_time': _isoformat(reservation.start_time),
+        'end_time': _isoformat(reservation.end_time),
+        'status': reservation.status
+    })
+
+
+def vehicle_event(action, vehicle):
+    return make_event(f'vehicle.{action}', {
+        'id': vehicle.id,
+        'status': vehicle.status,
+        'is_archived': vehicle.is_archived
+    })
+
+
+class EventBroker:
+    """In-process fan-out of committed events to subscribed streams"""
+
+    def __init__(self, history_size, resync_interval=None):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        # Seconds between resyncs for streams that cannot see every change
+        self.resync_interval = resync_interval
+
+    def stage(self, session, events):
+        """Hold events of the session's transaction until it commits"""
+        session.info.setdefault('events', []).extend(events)
+
+    def committed(self, session):
+        events = session.info.pop('events', None)
+        if events:
+            self.deliver(events)
+
+    def rolled_back(self, session):
+        session.info.pop('events', None)
+
+    def deliver(self, events):
+        with self._lock:
+            self._history.extend(events)
+            for subscriber in self._subscribers:
+                for item in events:
+                    try:
+                        subscriber.put_nowait(item)
+                    except queue.Full:
+                        # Too far behind to catch up; replace the backlog with a resync
+                        _drain(subscriber)
+                        subscriber.put_nowait(resync_event())
+                        break
+
+    def subscribe(self, last_event_id=None):
+        """Queue receiving every event delivered from now on.
+
+        A client resuming with last_event_id first gets the events it missed,
+        or a resync event when they are no longer in the history.
+        """
+        subscriber = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if last_event_id:
+                ids = [item['id'] for item in self._history]
+                missed = list(self._history)[ids.index(last_event_id) + 1:] if last_event_id in ids else None
+                if missed is None or len(missed) >= SUBSCRIBER_QUEUE_SIZE:
+                    missed = [resync_event()]
+                for item in missed:
+                    subscriber.put_nowait(item)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+
+class PostgresEventBroker(EventBroker):
+    """Broker relaying events between workers through LISTEN/NOTIFY"""
+
+    def __init__(self, history_size):
+        super().__init__(history_size)
+        self._listener_lock = threading.Lock()
+        self._listener = None
+
+    def stage(self, session, events):
+        # NOTIFY is transactional: sent on commit, discarded on rollback
+        connection = session.connection()
+        for item in events:
+            connection.execute(text('SELECT pg_notify(:channel, :payload)'),
+                               {'channel': NOTIFY_CHANNEL, 'payload': json.dumps(item)})
+
+    def committed(self, session):
+        # Delivered by the listener, like events of every other worker
+        pass
+
+    def subscribe(self, last_event_id=None):
+        self._ensure_listener(db.engine)
+        return super().subscribe(last_event_id)
+
+    def _ensure_listener(self, engine):
+        # Started on first use, so each forked worker runs its own listener
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, args=(engine,),
+                                                  name='event-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self, engine):
+        reconnecting = False
+        while True:
+            try:
+                connection = engine.raw_connection()
+                # Held for the life of the worker, so it must not occupy a pool slot
+                connection.detach()
+                try:
+                    dbapi_connection = connection.driver_connection
+                    dbapi_connection.rollback()
+                    dbapi_connection.autocommit = True
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+                    if reconnecting:
+                        # Notifications sent while disconnected are lost
+                        self.deliver([resync_event()])
+                    reconnecting = True
+                    while True:
+                        if select.select([dbapi_connection], [], [], 60) == ([], [], []):
+                            continue
+                        dbapi_connection.poll()
+                        events = []
+                        while dbapi_connection.notifies:
+                            events.append(json.loads(dbapi_connection.notifies.pop(0).payload))
+                        if events:
+                            self.deliver(events)
+                finally:
+                    connection.close()
+            except Exception as e:
+                logger.warning('Event listener connection failed: %s', e)
+                reconnecting = True
+                time.sleep(LISTEN_RETRY_INTERVAL)
+
+
+def _drain(subscriber):
+    while True:
+        try:
+            subscriber.get_nowait()
+        except queue.Empty:
+            return
+
+
+if EVENTS_BACKEND == 'postgres':
+    event_broker = PostgresEventBroker(EVENTS_HISTORY_SIZE)
+else:
+    # Changes committed by other workers never reach this one's streams
+    event_broker = EventBroker(EVENTS_HISTORY_SIZE,
+                               EVENTS_RESYNC_INTERVAL if int(os.environ.get('WEB_CONCURRENCY', 2)) > 1 else None)
+
+
+def _changed(instance, *attributes):
+    state = inspect(instance)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _stage_flushed_changes(session, flush_context):
+    events = []
+    for instance in session.new:
+        if isinstance(instance, Reservation):
+            events.append(reservation_event('created', instance))
+        elif isinstance(instance, Vehicle):
+            events.append(vehicle_event('created', instance))
+    for instance in session.dirty:
+        if isinstance(instance, Reservation) and session.is_modified(instance):
+            cancelled = _changed(instance, 'status') and instance.status == 'Zrusena'
+            events.append(reservation_event('cancelled' if cancelled else 'updated', instance))
+        elif isinstance(instance, Vehicle) and _changed(instance, 'status', 'is_archived'):
+            events.append(vehicle_event('status', instance))
+    for instance in session.deleted:
+        if isinstance(instance, Reservation):
+            events.append(reservation_event('deleted', instance))
+    if events:
+        event_broker.stage(session, events)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _stage_bulk_changes(orm_execute_state):
+    # Bulk statements carry no per-row state; clients have to refetch
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, (Reservation, Vehicle)):
+        event_broker.stage(orm_execute_state.session, [resync_event()])
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed_changes(session):
+    event_broker.committed(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    event_broker.rolled_back(session)
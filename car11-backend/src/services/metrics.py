@@ -0,0 +1,174 @@
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from flask import Response, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.services.principal import current_principal
+
+# Per-endpoint request metrics. Each request records wall time, SQL statement
+# count, SQL time and response size; the totals are served in Prometheus text
+# format on /metrics and the per-request figures as a Server-Timing header.
+# Metrics are per process, so every gunicorn worker reports its own series.
+# /metrics is for administrators, or for scrapers sending METRICS_TOKEN as a
+# bearer token.
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this many seconds are logged with their parameters
+SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', 0.2))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Series:
+    def __init__(self):
+        self.count = 0
+        self.duration_sum = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.response_bytes = 0
+
+
+class RequestMetrics:
+    """Totals per (endpoint, method, status) since the process started"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = defaultdict(_Series)
+
+    def record(self, endpoint, method, status, duration, sql_statements, sql_seconds, response_bytes):
+        with self._lock:
+            series = self._series[(endpoint, method, str(status))]
+            series.count += 1
+            series.duration_sum += duration
+            position = bisect_left(DURATION_BUCKETS, duration)
+            if position < len(DURATION_BUCKETS):
+                series.buckets[position] += 1
+            series.sql_statements += sql_statements
+            series.sql_seconds += sql_seconds
+            series.response_bytes += response_bytes
+
+    def render(self):
+        """Prometheus text exposition of all series"""
+        with self._lock:
+            items = [(f'endpoint="{_escape(endpoint)}",method="{method}",status="{status}"', series)
+                     for (endpoint, method, status), series in sorted(self._series.items())]
+            lines = [
+                '# HELP http_requests_total Requests handled.',
+                '# TYPE http_requests_total counter',
+            ]
+            lines += [f'http_requests_total{{{labels}}} {series.count}' for labels, series in items]
+            lines += [
+                '# HELP http_request_duration_seconds Wall time per request.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for labels, series in items:
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, series.buckets):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {series.count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {series.duration_sum:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {series.count}')
+            lines += [
+                '# HELP http_request_sql_statements_total SQL statements executed by requests.',
+                '# TYPE http_request_sql_statements_total counter',
+            ]
+            lines += [f'http_request_sql_statements_total{{{labels}}} {series.sql_statements}'
+                      for labels, series in items]
+            lines += [
+                '# HELP http_request_sql_seconds_total Time spent in SQL by requests.',
+                '# TYPE http_request_sql_seconds_total counter',
+            ]
+            lines += [f'http_request_sql_seconds_total{{{labels}}} {series.sql_seconds:.6f}'
+                      for labels, series in items]
+            lines += [
+                '# HELP http_response_size_bytes_total Response body bytes, streamed bodies excluded.',
+                '# TYPE http_response_size_bytes_total counter',
+            ]
+            lines += [f'http_response_size_bytes_total{{{labels}}} {series.response_bytes}'
+                      for labels, series in items]
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+# The start time lives on the execution context, which a failing statement
+# simply drops, so no state outlives it
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    context.statement_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.statement_started
+    in_request = has_request_context()
+    if in_request and 'sql_statements' in g:
+        g.sql_statements += 1
+        g.sql_seconds += elapsed
+    if elapsed >= SLOW_QUERY_THRESHOLD:
+        # Password hashes written to users must not end up in the log
+        writes_password = 'password_hash' in statement and not statement.lstrip().upper().startswith('SELECT')
+        shown = '<redacted>' if writes_password else parameters
+        logger.warning('Slow query (%.3fs) in %s: %s; parameters: %r',
+                       elapsed, _route() if in_request else 'no request', statement, shown)
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+
+
+def _after_request(response):
+    if 'request_started' not in g:
+        return response
+    duration = time.perf_counter() - g.request_started
+    # Streamed bodies are produced after this hook; their size is not known
+    size = 0 if response.is_streamed else (response.calculate_content_length() or 0)
+    request_metrics.record(_route(), request.method, response.status_code,
+                           duration, g.sql_statements, g.sql_seconds, size)
+    response.headers.add('Server-Timing', f'app;dur={duration * 1000:.1f}')
+    if not response.is_streamed:
+        # A streamed body runs most of its queries after this point
+        response.headers.add('Server-Timing',
+                             f'db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_statements} queries"')
+    return response
+
+
+def _scraper_authorized():
+    authorization = request.headers.get('Authorization', '')
+    return bool(METRICS_TOKEN) and hmac.compare_digest(authorization.encode(), f'Bearer {METRICS_TOKEN}'.encode())
+
+
+def register_instrumentation(app):
+    """Install the request hooks and the /metrics endpoint"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.get('/metrics')
+    def metrics():
+        if not _scraper_authorized():
+            principal = current_principal()
+            if not principal or not principal.is_active:
+                return jsonify({'error': 'Authentication required'}), 401
+            if not principal.is_admin:
+                return jsonify({'error': 'Administrator privileges required'}), 403
+        return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,68 @@
+import click
+import logging
+from flask.cli import AppGroup
+from sqlalchemy import inspect
+from src.models.models import db
+from src.services.versions import ensure_versions
+from src.services.scheduler import ensure_jobs
+from src.services.rollup import ensure_backfilled
+
+# db.create_all() only creates missing tables; it never touches tables that
+# already exist. Indexes declared on the models after a deployment went live
+# are therefore created here, by comparing the model metadata with the
+# indexes the database reports.
+
+logger = logging.getLogger(__name__)
+
+schema_cli = AppGroup('schema', help='Bring the database schema in line with the models.')
+
+
+def missing_indexes():
+    """Indexes declared on the models that do not exist in the database yet"""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in sorted(table.indexes, key=lambda index: index.name)
+                       if index.name not in existing)
+    return missing
+
+
+def upgrade():
+    """Create missing tables, version counters and job rows, then missing indexes on existing tables"""
+    db.create_all()
+    ensure_versions()
+    ensure_jobs()
+    created = []
+    for index in missing_indexes():
+        logger.info('Creating index %s on %s', index.name, index.table.name)
+        index.create(bind=db.engine, checkfirst=True)
+        created.append(index)
+    return created
+
+
+@schema_cli.command('upgrade')
+def upgrade_command():
+    """Create tables and indexes missing from the database, and backfill the rollup"""
+    created = upgrade()
+    for index in created:
+        click.echo(f'Created {index.name} on {index.table.name}')
+    click.echo(f'{len(created)} index(es) created')
+    # Once per deployment rather than in every worker at startup
+    if ensure_backfilled():
+        click.echo('Built daily_vehicle_stats from existing data')
+
+
+@schema_cli.command('status')
+def status_command():
+    """List indexes declared on the models but missing from the database"""
+    missing = missing_indexes()
+    for index in missing:
+        columns = ', '.join(column.name for column in index.columns)
+        click.echo(f'missing {index.name} on {index.table.name} ({columns})')
+    if missing:
+        raise click.ClickException(f'{len(missing)} index(es) missing; run `flask schema upgrade`')
+    click.echo('All declared indexes exist')
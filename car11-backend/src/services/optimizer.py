@@ -0,0 +1,303 @@
+import click
+import hashlib
+import json
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from flask.cli import AppGroup
+from src.models.models import db, Vehicle, Reservation
+from src.services.availability import reservation_index, lock_vehicles, find_double_bookings, overlap_filter
+from src.services.rollup import refresh_bookings, reservation_days
+
+# Reassignment of future confirmed reservations across compatible vehicles.
+# Every vehicle keeps a timeline of its bookings, and movable bookings are
+# recoloured greedily in start order, the vehicles being the colours of the
+# interval graph. A booking only moves into a gap of another vehicle's
+# timeline, so no plan can ever double-book. A compatible vehicle is active,
+# has the same transmission as the booked one and enough seats for the
+# passengers.
+#
+# Goals:
+# - free: move every booking off the given vehicles, e.g. for a maintenance
+#   window. Each booking takes the best-fitting gap, the one leaving the
+#   least idle time around it.
+# - balance: move bookings off vehicles booked above the fleet average into
+#   the least-used compatible vehicle, as long as that narrows the spread.
+#
+# Bookings starting within MIN_LEAD_TIME stay where they are, so nobody's car
+# changes at the last moment.
+#
+# Planning never writes. A plan carries a plan_id hashing its moves; applying
+# takes the reviewed moves back together with that id and writes exactly
+# them, or nothing when the bookings changed in between.
+
+optimizer_cli = AppGroup('optimize', help='Reassign future reservations across the fleet.')
+
+GOALS = ('balance', 'free')
+MIN_LEAD_TIME = timedelta(hours=24)
+DEFAULT_HORIZON_DAYS = 14
+# Vehicles booked less than this much above the class average are left alone
+BALANCE_TOLERANCE = 0.1
+# Idle time counted next to a booking with no neighbour on that side
+OPEN_GAP = timedelta(days=365)
+
+
+class StalePlan(Exception):
+    """The bookings changed between planning and applying"""
+
+
+class _Timeline:
+    """Non-overlapping bookings of one vehicle sorted by start time"""
+
+    def __init__(self):
+        self.entries = []  # (start_time, end_time, reservation_id)
+
+    def add(self, entry):
+        insort(self.entries, entry)
+
+    def remove(self, entry):
+        del self.entries[bisect_left(self.entries, entry)]
+
+    def gaps(self, start_time, end_time):
+        """Idle time before and after the period, or None when it overlaps a booking"""
+        position = bisect_left(self.entries, (start_time,))
+        before = self.entries[position - 1] if position else None
+        after = self.entries[position] if position < len(self.entries) else None
+        if (before and before[1] > start_time) or (after and after[0] < end_time):
+            return None
+        return (start_time - before[1] if before else OPEN_GAP,
+                after[0] - end_time if after else OPEN_GAP)
+
+
+def _hours(start_time, end_time, period_start, period_end):
+    overlap = min(end_time, period_end) - max(start_time, period_start)
+    return max(overlap.total_seconds(), 0) / 3600
+
+
+def _spread(hours, vehicle_ids):
+    values = [hours[vehicle_id] for vehicle_id in vehicle_ids]
+    return round(max(values) - min(values), 2) if values else 0.0
+
+
+def plan_id(moves):
+    """Hash identifying a list of moves, as returned by plan()"""
+    canonical = json.dumps(sorted(moves, key=lambda move: move['reservation_id']), sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def plan(start_date, end_date, goal='balance', free_vehicle_ids=()):
+    """Compute reassignments for bookings starting within [start_date, end_date].
+
+    Returns a dict with the moves, the bookings that could not be placed and
+    the utilization spread (busiest minus idlest vehicle, in hours) before
+    and after. Nothing is written.
+    """
+    if goal not in GOALS:
+        raise ValueError(f'goal must be one of {", ".join(GOALS)}')
+    free_vehicle_ids = set(free_vehicle_ids)
+    if goal == 'free' and not free_vehicle_ids:
+        raise ValueError('goal free needs the vehicles to free')
+
+    period_start = datetime.combine(start_date, time.min)
+    period_end = datetime.combine(end_date + timedelta(days=1), time.min)
+    movable_from = max(period_start, datetime.now() + MIN_LEAD_TIME)
+
+    vehicles = {vehicle.id: vehicle for vehicle in Vehicle.query}
+    targets = [vehicle for vehicle in vehicles.values()
+               if not vehicle.is_archived and vehicle.status == 'Aktivni' and vehicle.id not in free_vehicle_ids]
+    targets.sort(key=lambda vehicle: vehicle.id)
+
+    bookings = Reservation.query.filter(overlap_filter(period_start, period_end)).all()
+    movable = [booking for booking in bookings if movable_from <= booking.start_time < period_end]
+    # Later bookings a moved one could run into
+    horizon_end = max([booking.end_time for booking in movable], default=period_end)
+    bookings += Reservation.query.filter(
+        Reservation.status == 'Potvrzena',
+        Reservation.start_time >= period_end,
+        Reservation.start_time < horizon_end
+    ).all()
+
+    timelines = defaultdict(_Timeline)
+    hours = defaultdict(float)
+    for booking in bookings:
+        timelines[booking.vehicle_id].add((booking.start_time, booking.end_time, booking.id))
+        hours[booking.vehicle_id] += _hours(booking.start_time, booking.end_time, period_start, period_end)
+
+    classes = defaultdict(list)
+    for vehicle in targets:
+        classes[vehicle.transmission].append(vehicle.id)
+    spread_before = {transmission: _spread(hours, ids) for transmission, ids in classes.items()}
+    average = {transmission: sum(hours[vehicle_id] for vehicle_id in ids) / len(ids)
+               for transmission, ids in classes.items()}
+
+    moves, unresolved = [], []
+    for booking in sorted(movable, key=lambda booking: (booking.start_time, booking.id)):
+        current = vehicles[booking.vehicle_id]
+        duration = _hours(booking.start_time, booking.end_time, period_start, period_end)
+        if goal == 'free':
+            if current.id not in free_vehicle_ids:
+                continue
+        elif hours[current.id] <= average.get(current.transmission, 0) * (1 + BALANCE_TOLERANCE):
+            continue
+
+        candidates = classes.get(current.transmission, [])
+        if goal == 'balance':
+            # Least used first, so the first vehicle with a fitting gap wins
+            candidates = sorted(candidates, key=lambda vehicle_id: (hours[vehicle_id], vehicle_id))
+        best, best_key = None, None
+        for vehicle_id in candidates:
+            vehicle = vehicles[vehicle_id]
+            if vehicle.id == current.id or vehicle.seating_capacity < (booking.passenger_count or 1):
+                continue
+            if goal == 'balance' and hours[vehicle.id] + duration >= hours[current.id]:
+                break  # neither this nor any busier vehicle would narrow the spread
+            gaps = timelines[vehicle.id].gaps(booking.start_time, booking.end_time)
+            if gaps is None:
+                continue
+            if goal == 'balance':
+                best = vehicle
+                break
+            key = (sum(gaps, timedelta(0)), vehicle.id)
+            if best_key is None or key < best_key:
+                best, best_key = vehicle, key
+
+        if best is None:
+            if goal == 'free':
+                unresolved.append(booking)
+            continue
+        entry = (booking.start_time, booking.end_time, booking.id)
+        timelines[current.id].remove(entry)
+        timelines[best.id].add(entry)
+        hours[current.id] -= duration
+        hours[best.id] += duration
+        moves.append((booking, current, best))
+
+    if goal == 'free':
+        # Bookings starting too soon to move keep the vehicles occupied
+        unresolved += [booking for booking in bookings
+                       if booking.vehicle_id in free_vehicle_ids and booking.start_time < movable_from]
+
+    result = {
+        'goal': goal,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'moves': [{
+            'reservation_id': booking.id,
+            'start_time': booking.start_time.isoformat(),
+            'end_time': booking.end_time.isoformat(),
+            'passenger_count': booking.passenger_count,
+            'from_vehicle_id': source.id,
+            'from_license_plate': source.license_plate,
+            'to_vehicle_id': target.id,
+            'to_license_plate': target.license_plate
+        } for booking, source, target in moves],
+        'unresolved': [{
+            'reservation_id': booking.id,
+            'vehicle_id': booking.vehicle_id,
+            'start_time': booking.start_time.isoformat(),
+            'end_time': booking.end_time.isoformat()
+        } for booking in sorted(unresolved, key=lambda booking: (booking.start_time, booking.id))],
+        'spread_hours': {transmission: {'before': spread_before[transmission],
+                                        'after': _spread(hours, ids)}
+                         for transmission, ids in classes.items()}
+    }
+    result['plan_id'] = plan_id(result['moves'])
+    return result
+
+
+def apply(moves, expected_plan_id):
+    """Write reviewed moves of a plan in one transaction.
+
+    Raises ValueError when the moves are malformed or do not hash to
+    expected_plan_id, and StalePlan, writing nothing, when a moved booking
+    changed since planning, a target vehicle can no longer take it, or the
+    new assignment would overlap a booking made meanwhile.
+    """
+    try:
+        if plan_id(moves) != expected_plan_id:
+            raise ValueError('moves do not match plan_id')
+        moves = {int(move['reservation_id']): dict(move, from_vehicle_id=int(move['from_vehicle_id']),
+                                                   to_vehicle_id=int(move['to_vehicle_id']))
+                 for move in moves}
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError('moves must be the moves of a plan')
+    if not moves:
+        return 0
+    touched = {move['from_vehicle_id'] for move in moves.values()} | \
+        {move['to_vehicle_id'] for move in moves.values()}
+    lock_vehicles(*touched)
+
+    targets = {vehicle.id: vehicle for vehicle in Vehicle.query.filter(Vehicle.id.in_(touched))}
+    reservations = Reservation.query.filter(Reservation.id.in_(moves)).all()
+    spans = {}
+    for reservation in reservations:
+        move = moves[reservation.id]
+        if (reservation.status != 'Potvrzena' or reservation.vehicle_id != move['from_vehicle_id']
+                or reservation.start_time.isoformat() != move['start_time']
+                or reservation.end_time.isoformat() != move['end_time']):
+            db.session.rollback()
+            raise StalePlan(f'Reservation {reservation.id} changed since planning')
+        target = targets.get(move['to_vehicle_id'])
+        if (target is None or target.is_archived or target.status != 'Aktivni'
+                or target.seating_capacity < (reservation.passenger_count or 1)):
+            db.session.rollback()
+            raise StalePlan(f'Vehicle {move["to_vehicle_id"]} can no longer take reservation {reservation.id}')
+        span = reservation_days(reservation.start_time, reservation.end_time)
+        created_day = (reservation.created_at or datetime.utcnow()).date()
+        for vehicle_id in (move['from_vehicle_id'], move['to_vehicle_id']):
+            booking_spans, created_days = spans.setdefault(vehicle_id, ([], set()))
+            booking_spans.append(span)
+            created_days.add(created_day)
+        reservation.vehicle_id = move['to_vehicle_id']
+    if len(reservations) != len(moves):
+        db.session.rollback()
+        raise StalePlan('A reservation to move no longer exists')
+
+    db.session.flush()
+    if find_double_bookings(touched):
+        db.session.rollback()
+        raise StalePlan('A vehicle was booked meanwhile')
+    for vehicle_id, (booking_spans, created_days) in spans.items():
+        refresh_bookings(vehicle_id, booking_spans, created_days)
+    db.session.commit()
+    for reservation in reservations:
+        reservation_index.update(reservation)
+    return len(reservations)
+
+
+@optimizer_cli.command('fleet')
+@click.option('--goal', type=click.Choice(GOALS), default='balance', show_default=True)
+@click.option('--vehicle', 'vehicle_ids', type=int, multiple=True, help='Vehicle to free (goal free).')
+@click.option('--start', 'start_date', type=click.DateTime(['%Y-%m-%d']), help='First day, default today.')
+@click.option('--days', default=DEFAULT_HORIZON_DAYS, show_default=True, help='Days in the horizon.')
+@click.option('--apply', 'apply_plan_id', metavar='PLAN_ID',
+              help='Write the moves of the plan reviewed under this id.')
+def optimize_fleet_command(goal, vehicle_ids, start_date, days, apply_plan_id):
+    """Plan, and with --apply make, vehicle reassignments"""
+    start_date = start_date.date() if start_date else date.today()
+    try:
+        result = plan(start_date, start_date + timedelta(days=days - 1), goal, vehicle_ids)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    for move in result['moves']:
+        click.echo(f"#{move['reservation_id']} {move['start_time']} - {move['end_time']}: "
+                   f"{move['from_license_plate']} -> {move['to_license_plate']}")
+    for booking in result['unresolved']:
+        click.echo(f"#{booking['reservation_id']} {booking['start_time']}: "
+                   f"cannot move off vehicle {booking['vehicle_id']}")
+    for transmission, spread in result['spread_hours'].items():
+        click.echo(f"{transmission}: utilization spread {spread['before']}h -> {spread['after']}h")
+
+    if not apply_plan_id:
+        click.echo(f"{len(result['moves'])} move(s) planned as plan {result['plan_id']}; "
+                   f"run again with --apply {result['plan_id']} to make them")
+        return
+    # Only the reviewed moves are written; any difference means a new review
+    if result['plan_id'] != apply_plan_id:
+        raise click.ClickException(f"The plan changed since plan {apply_plan_id} was reviewed; "
+                                   f"review the moves above and apply {result['plan_id']} instead")
+    try:
+        click.echo(f"{apply(result['moves'], apply_plan_id)} reservation(s) reassigned")
+    except StalePlan as e:
+        raise click.ClickException(f'{e}; run again to plan from the current bookings')
@@ -0,0 +1,98 @@
+import base64
+import json
+from datetime import date, datetime
+from flask import request, jsonify
+from sqlalchemy import and_, or_
+from src.services.serialization import with_profile
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+# Response headers carrying the pagination state; the body stays a plain JSON
+# array so existing clients keep working and simply receive the first page.
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+TOTAL_COUNT_HEADER = 'X-Total-Count'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page"""
+    raw = json.dumps([value.isoformat() if isinstance(value, (date, datetime)) else value
+                      for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor back into values typed like the sort columns"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(raw, list) or len(raw) != len(columns):
+            raise InvalidCursor(cursor)
+        values = []
+        for column, value in zip(columns, raw):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            else:
+                value = python_type(value)
+            values.append(value)
+        return values
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def _after(order_by, values):
+    """Keyset condition selecting rows that sort after the given key"""
+    branches = []
+    for position, (column, descending) in enumerate(order_by):
+        equal = [order_by[i][0] == values[i] for i in range(position)]
+        beyond = column < values[position] if descending else column > values[position]
+        branches.append(and_(*equal, beyond))
+    return or_(*branches)
+
+
+def paginated_response(query, order_by, profile=None):
+    """Serialize one keyset page of a query.
+
+    order_by is a list of (column, descending) pairs ending with a unique
+    column so the key is total. Reads limit, cursor and include_total from the
+    request arguments and returns the rows as a JSON array, with the cursor of
+    the next page (if any) and the optional total in response headers.
+    """
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
+    columns = [column for column, descending in order_by]
+
+    total = query.order_by(None).count() if include_total else None
+
+    if cursor:
+        try:
+            values = decode_cursor(cursor, columns)
+        except InvalidCursor:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(_after(order_by, values))
+
+    query = query.order_by(*[column.desc() if descending else column.asc()
+                             for column, descending in order_by])
+    if profile:
+        query = with_profile(query, profile)
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    response = jsonify([row.to_dict() for row in rows])
+    if has_more:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            [getattr(rows[-1], column.key) for column in columns])
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+    return response
@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+import time
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing is deliberately expensive. Every hash and verification runs
+# in a small dedicated thread pool, and the request thread waits for it. At
+# most PASSWORD_POOL_LIMIT request threads may wait at once, fewer than the
+# worker's gthread threads, so a burst of logins cannot starve the other
+# endpoints. Callers beyond the limit get PasswordPoolBusy, i.e. a 503 with
+# Retry-After, right away instead of queueing.
+
+logger = logging.getLogger(__name__)
+
+# 'bcrypt', or 'werkzeug' for werkzeug's generate_password_hash
+PASSWORD_HASH_SCHEME = os.environ.get('PASSWORD_HASH_SCHEME', 'bcrypt')
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# Method passed to generate_password_hash, e.g. 'scrypt' or 'pbkdf2:sha256:600000'
+WERKZEUG_HASH_METHOD = os.environ.get('WERKZEUG_HASH_METHOD', 'scrypt')
+
+PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', 2))
+# Request threads per gunicorn worker, as passed to --threads, and those of
+# them left to the API when the rest serve event streams
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+API_THREADS = int(os.environ.get('API_THREADS', 4))
+# Password checks admitted at once, running or waiting; one API thread stays free
+PASSWORD_POOL_LIMIT = int(os.environ.get('PASSWORD_POOL_LIMIT', max(min(GUNICORN_THREADS, API_THREADS) - 1, 1)))
+# Waits above this many seconds are logged
+SLOW_QUEUE_WAIT = 1.0
+
+
+class PasswordPoolBusy(RuntimeError):
+    pass
+
+
+def _is_bcrypt(password_hash):
+    return password_hash.startswith(('$2a$', '$2b$', '$2y$'))
+
+
+def _hash(password):
+    if PASSWORD_HASH_SCHEME == 'bcrypt':
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('ascii')
+    return generate_password_hash(password, method=WERKZEUG_HASH_METHOD)
+
+
+def _verify(password_hash, password):
+    if _is_bcrypt(password_hash):
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('ascii'))
+    return check_password_hash(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """Whether a stored hash was made with a different scheme or cost than configured"""
+    if PASSWORD_HASH_SCHEME == 'bcrypt':
+        return not _is_bcrypt(password_hash) or password_hash[4:6] != f'{BCRYPT_ROUNDS:02d}'
+    if _is_bcrypt(password_hash):
+        return True
+    # werkzeug hashes are "method$salt$hash"; newer werkzeug versions spell out
+    # the default parameters, so compare only the parts that were configured
+    method = password_hash.split('$', 1)[0].split(':')
+    configured = WERKZEUG_HASH_METHOD.split(':')
+    return method[:len(configured)] != configured
+
+
+class PasswordPool:
+    """Bounded executor for password hashing with queue-time statistics"""
+
+    def __init__(self, workers, limit):
+        # More workers than admitted callers would never be busy
+        self.workers = min(workers, limit)
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self._executor = None  # created on first use, i.e. after gunicorn forks
+        self._waiting = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def run(self, fn, *args):
+        """Run fn(*args) in the pool and return its result"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordPoolBusy('Too many concurrent password checks')
+        try:
+            submitted = time.monotonic()
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password')
+                self._waiting += 1
+            return self._executor.submit(self._call, submitted, fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _call(self, submitted, fn, *args):
+        wait = time.monotonic() - submitted
+        with self._lock:
+            self._waiting -= 1
+            self._completed += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        if wait > SLOW_QUEUE_WAIT:
+            logger.warning('Password check waited %.2fs for a pool thread', wait)
+        return fn(*args)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'limit': self.limit,
+                'waiting': self._waiting,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'queue_wait_avg': self._wait_total / self._completed if self._completed else 0.0,
+                'queue_wait_max': self._wait_max
+            }
+
+
+password_pool = PasswordPool(PASSWORD_POOL_WORKERS, PASSWORD_POOL_LIMIT)
+
+
+def hash_password(password):
+    return password_pool.run(_hash, password)
+
+
+def verify_password(password_hash, password):
+    return password_pool.run(_verify, password_hash, password)
@@ -0,0 +1,83 @@
+import os
+from flask import g, request, session
+from src.models.models import db, User, Role
+from src.services.cache import LRUCache
+from src.services.tokens import InvalidToken, decode_token, tokens_enabled
+
+ADMIN_ROLE = 'Administrator'
+
+# Principals are shared across requests of this worker. The user and role
+# endpoints invalidate entries on change; the TTL bounds how long another
+# gunicorn worker may keep serving a stale role or activation state.
+principal_cache = LRUCache(
+    maxsize=int(os.environ.get('PRINCIPAL_CACHE_SIZE', 1024)),
+    ttl=int(os.environ.get('PRINCIPAL_CACHE_TTL', 60))
+)
+
+
+class Principal:
+    """The authenticated user and role, detached from any database session"""
+
+    __slots__ = ('id', 'username', 'is_active', 'role_id', 'role_name')
+
+    def __init__(self, id, username, is_active, role_id, role_name):
+        self.id = id
+        self.username = username
+        self.is_active = is_active
+        self.role_id = role_id
+        self.role_name = role_name
+
+    @property
+    def is_admin(self):
+        return self.role_name == ADMIN_ROLE
+
+
+def load_principal(user_id):
+    """Principal for a user id, from the cache or with one joined query"""
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        row = db.session.query(User.id, User.username, User.is_active, Role.id, Role.name) \
+            .join(Role, User.role_id == Role.id) \
+            .filter(User.id == user_id) \
+            .first()
+        if row is None:
+            return None
+        principal = Principal(*row)
+        principal_cache.set(user_id, principal)
+    return principal
+
+
+def principal_from_claims(claims):
+    """Principal described by a verified access token, without a database lookup"""
+    return Principal(int(claims['sub']), claims['username'], claims['active'],
+                     claims['role_id'], claims['role'])
+
+
+def _authenticate():
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        if not tokens_enabled():
+            return None
+        try:
+            g.token_claims = decode_token(authorization[len('Bearer '):], 'access')
+        except InvalidToken:
+            return None
+        return principal_from_claims(g.token_claims)
+    user_id = session.get('user_id')
+    return load_principal(user_id) if user_id is not None else None
+
+
+def current_principal():
+    """Principal of the bearer token or session user, resolved at most once per request"""
+    if 'principal' not in g:
+        g.principal = _authenticate()
+    return g.principal
+
+
+def forget_principal(user_id=None):
+    """Drop one cached principal, or all of them when a role changed"""
+    if user_id is None:
+        principal_cache.clear()
+    else:
+        principal_cache.pop(user_id)
+    g.pop('principal', None)
@@ -0,0 +1,141 @@
+import click
+from contextlib import contextmanager
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from src.models.models import db, User, Role
+
+# Maximum number of SQL statements each list endpoint may issue for an
+# administrator, independent of how many rows it returns.
+QUERY_BUDGETS = {
+    '/api/reservations': 3,
+    '/api/reservations/calendar?start_date=2000-01-01&end_date=2100-01-01': 2,
+    '/api/reservations/calendar?start_date=2000-01-01&end_date=2100-01-01&format=compact': 2,
+    '/api/vehicles': 2,
+    '/api/users': 3,
+    '/api/service-records': 3,
+    '/api/damage-records': 3,
+}
+
+# Endpoints whose statements must be answered from indexes. Every statement
+# they issue is EXPLAINed; a full scan of one of PLAN_CHECKED_TABLES fails the
+# check. Small reference tables (roles, users, vehicles) may be scanned.
+HOT_QUERY_PATHS = [
+    '/api/reservations',
+    '/api/reservations?vehicle_id=1&status=Potvrzena',
+    '/api/reservations?start_date=2024-01-01&end_date=2024-12-31',
+    '/api/reservations/calendar?start_date=2024-01-01&end_date=2024-02-01',
+    '/api/reservations/calendar?start_date=2024-01-01&end_date=2024-02-01&format=compact',
+    '/api/vehicles/available?start_time=2024-06-01T08:00:00&end_time=2024-06-01T17:00:00',
+    '/api/service-records',
+    '/api/service-records?vehicle_id=1',
+    '/api/damage-records',
+    '/api/damage-records?vehicle_id=1',
+    '/api/vehicle-utilization?start_date=2024-01-01&end_date=2024-12-31',
+    '/api/cost-analysis?start_date=2024-01-01&end_date=2024-12-31',
+]
+PLAN_CHECKED_TABLES = ('reservations', 'service_records', 'damage_records', 'daily_vehicle_stats')
+
+
+class QueryCounter:
+    """Collects the SQL statements executed while it is active"""
+
+    def __init__(self):
+        self.statements = []
+        self.parameters = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Count statements sent to the database inside the block"""
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._before_cursor_execute)
+
+
+def _admin_client():
+    """Test client logged in as an active administrator"""
+    admin = User.query.join(Role).filter(Role.name == 'Administrator', User.is_active == True).first()
+    if not admin:
+        raise click.ClickException('An active administrator is required')
+
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = admin.id
+    return client
+
+
+def sequential_scans(statement, parameters):
+    """Tables in PLAN_CHECKED_TABLES that the statement reads with a full scan"""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        # With seq scans disabled the planner still falls back to one when no
+        # index can serve the query, so small datasets do not mask a missing index
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = connection.exec_driver_sql('EXPLAIN ' + statement, parameters).scalars().all()
+        scanned = [line.split(' on ', 1)[1].split()[0] for line in plan if 'Seq Scan on ' in line]
+    else:
+        plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+        scanned = [row[-1].split()[1] for row in plan
+                   if row[-1].startswith('SCAN ') and ' USING ' not in row[-1]]
+    return sorted({table for table in scanned if table in PLAN_CHECKED_TABLES})
+
+
+@click.command('check-query-counts')
+@with_appcontext
+def check_query_counts_command():
+    """Fail if a list endpoint issues more statements than its budget"""
+    client = _admin_client()
+
+    failures = 0
+    for path, budget in QUERY_BUDGETS.items():
+        db.session.remove()
+        with count_queries() as counter:
+            response = client.get(path)
+        rows = len(response.get_json() or [])
+        status = 'ok' if counter.count <= budget and response.status_code == 200 else 'FAIL'
+        if status == 'FAIL':
+            failures += 1
+        click.echo(f"{status:4} {path}: {counter.count} queries (budget {budget}), {rows} rows")
+
+    if failures:
+        raise click.ClickException(f'{failures} endpoint(s) exceeded their query budget')
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """Fail if a hot endpoint query reads a large table with a sequential scan"""
+    client = _admin_client()
+
+    failures = 0
+    for path in HOT_QUERY_PATHS:
+        db.session.remove()
+        with count_queries() as counter:
+            response = client.get(path)
+        db.session.remove()
+        scanned = set()
+        for statement, parameters in zip(counter.statements, counter.parameters):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                scanned.update(sequential_scans(statement, parameters))
+        db.session.rollback()
+        status = 'ok' if not scanned and response.status_code == 200 else 'FAIL'
+        if status == 'FAIL':
+            failures += 1
+        detail = f"sequential scan of {', '.join(sorted(scanned))}" if scanned else 'indexed'
+        click.echo(f"{status:4} {path}: {counter.count} queries, {detail} (HTTP {response.status_code})")
+
+    if failures:
+        raise click.ClickException(f'{failures} endpoint(s) fell back to a sequential scan')
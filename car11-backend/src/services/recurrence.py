@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+# Subset of RFC 5545 recurrence rules used by recurring bookings:
+# FREQ=DAILY|WEEKLY|MONTHLY with INTERVAL, COUNT, UNTIL and BYDAY (weekday
+# names only, no ordinals). Weeks start on Monday. Either COUNT or UNTIL is
+# required, and no rule may expand to more than MAX_OCCURRENCES bookings.
+
+MAX_OCCURRENCES = 366
+WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+
+class InvalidRecurrence(ValueError):
+    pass
+
+
+def parse_rule(rule):
+    """Parse an RRULE string into a dict of its supported parts"""
+    if rule.upper().startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
+    parts = {}
+    for part in rule.strip().strip(';').split(';'):
+        name, separator, value = part.partition('=')
+        if not separator or not value:
+            raise InvalidRecurrence(f'Malformed rule part {part!r}')
+        parts[name.strip().upper()] = value.strip().upper()
+
+    unsupported = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY'}
+    if unsupported:
+        raise InvalidRecurrence(f"Unsupported rule parts: {', '.join(sorted(unsupported))}")
+    if parts.get('FREQ') not in FREQUENCIES:
+        raise InvalidRecurrence(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+    if ('COUNT' in parts) == ('UNTIL' in parts):
+        raise InvalidRecurrence('Exactly one of COUNT and UNTIL is required')
+
+    try:
+        parsed = {
+            'freq': parts['FREQ'],
+            'interval': int(parts.get('INTERVAL', 1)),
+            'count': int(parts['COUNT']) if 'COUNT' in parts else None,
+            'until': _parse_until(parts['UNTIL']) if 'UNTIL' in parts else None,
+            'byday': sorted({WEEKDAYS.index(day) for day in parts['BYDAY'].split(',')}) if 'BYDAY' in parts else None
+        }
+    except ValueError as e:
+        raise InvalidRecurrence(f'Invalid rule value: {e}') from e
+    if parsed['interval'] < 1 or (parsed['count'] is not None and parsed['count'] < 1):
+        raise InvalidRecurrence('INTERVAL and COUNT must be positive')
+    if parsed['byday'] and parsed['freq'] == 'MONTHLY':
+        raise InvalidRecurrence('BYDAY is only supported with DAILY and WEEKLY')
+    return parsed
+
+
+def _parse_until(value):
+    value = value.rstrip('Z')
+    if 'T' in value:
+        return datetime.strptime(value, '%Y%m%dT%H%M%S')
+    # A date-only UNTIL includes that whole day
+    return datetime.strptime(value, '%Y%m%d') + timedelta(days=1) - timedelta(microseconds=1)
+
+
+def _add_months(moment, months):
+    """Same day and time months later, or None when that month is too short"""
+    month_index = moment.month - 1 + months
+    try:
+        return moment.replace(year=moment.year + month_index // 12, month=month_index % 12 + 1)
+    except ValueError:
+        return None
+
+
+def _candidates(rule, start_time):
+    """Occurrence starts in order"""
+    # Bounded, since a rule like FREQ=DAILY;INTERVAL=7;BYDAY=TU may never match
+    for step in range(MAX_OCCURRENCES * 31):
+        if rule['freq'] == 'MONTHLY':
+            moment = _add_months(start_time, step * rule['interval'])
+            if moment is not None:
+                yield moment
+        elif rule['freq'] == 'DAILY':
+            moment = start_time + timedelta(days=step * rule['interval'])
+            if rule['byday'] is None or moment.weekday() in rule['byday']:
+                yield moment
+        else:
+            week_start = start_time - timedelta(days=start_time.weekday()) + timedelta(weeks=step * rule['interval'])
+            for weekday in rule['byday'] if rule['byday'] is not None else [start_time.weekday()]:
+                moment = week_start + timedelta(days=weekday)
+                if moment >= start_time:
+                    yield moment
+
+
+def iter_occurrences(rule, start_time, end_time):
+    """(start, end) pairs of every occurrence of a booking under an RRULE string, lazily"""
+    parsed = parse_rule(rule)
+    duration = end_time - start_time
+    count = 0
+    for moment in _candidates(parsed, start_time):
+        if parsed['until'] is not None and moment > parsed['until']:
+            break
+        if count == MAX_OCCURRENCES:
+            raise InvalidRecurrence(f'Rule expands to more than {MAX_OCCURRENCES} occurrences')
+        count += 1
+        yield moment, moment + duration
+        if parsed['count'] is not None and count == parsed['count']:
+            break
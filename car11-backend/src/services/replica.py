@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+# Optional read replica. When DATABASE_READ_URL is set it is registered as
+# the REPLICA_BIND bind, and views decorated with read_replica() run their
+# queries there. Everything else, every flush, and any request from a client
+# that wrote within the staleness bound stays on the primary.
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+# Default staleness bound for list endpoints, in seconds
+REPLICA_MAX_STALENESS = float(os.environ.get('REPLICA_MAX_STALENESS', 5))
+# Reports aggregate history and can tolerate a longer lag
+REPORT_MAX_STALENESS = float(os.environ.get('REPORT_MAX_STALENESS', 60))
+# Replication lag is measured at most this often per worker
+LAG_CHECK_INTERVAL = 5.0
+
+# Flask session key holding the time of the client's last committed write
+LAST_WRITE_KEY = 'last_write_at'
+
+_lag_lock = threading.Lock()
+_lag = {'checked_at': None, 'seconds': None}
+
+
+class RoutingSession(Session):
+    """Session sending reads of replica-routed requests to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('read_replica'):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_engine():
+    return current_app.extensions['sqlalchemy'].engines.get(REPLICA_BIND)
+
+
+def _measure_lag(engine):
+    if engine.dialect.name != 'postgresql':
+        # Nothing to measure, e.g. two local SQLite files
+        return 0.0
+    with engine.connect() as connection:
+        return connection.execute(text(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )).scalar()
+
+
+def replica_lag():
+    """Replication lag in seconds, None when the replica cannot be reached"""
+    engine = _replica_engine()
+    if engine is None:
+        return None
+    now = time.monotonic()
+    with _lag_lock:
+        if _lag['checked_at'] is not None and now - _lag['checked_at'] < LAG_CHECK_INTERVAL:
+            return _lag['seconds']
+        _lag['checked_at'] = now
+    try:
+        seconds = float(_measure_lag(engine))
+    except Exception as e:
+        logger.warning('Replica lag check failed: %s', e)
+        seconds = None
+    with _lag_lock:
+        _lag['seconds'] = seconds
+    return seconds
+
+
+def use_replica(max_staleness):
+    """Whether the current request may read data up to max_staleness seconds old"""
+    if _replica_engine() is None:
+        return False
+    last_write = session.get(LAST_WRITE_KEY)
+    if last_write is not None and time.time() - last_write < max_staleness:
+        return False
+    lag = replica_lag()
+    return lag is not None and lag <= max_staleness
+
+
+def read_replica(max_staleness=None):
+    """Route a read-only view to the replica while it is fresh enough"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            bound = REPLICA_MAX_STALENESS if max_staleness is None else max_staleness
+            g.read_replica = use_replica(bound)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _record_client_write(db_session):
+    # Lets the writing client read its own writes from the primary afterwards
+    if db_session.info.pop('wrote', False) and has_request_context() and _replica_engine() is not None:
+        session[LAST_WRITE_KEY] = time.time()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(db_session):
+    db_session.info.pop('wrote', None)
@@ -0,0 +1,202 @@
+import click
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from flask.cli import AppGroup
+from sqlalchemy import and_, func, insert, or_
+from src.models.models import db, Vehicle, Reservation, ServiceRecord, DamageRecord, DailyVehicleStat
+from src.services.availability import occupying_filter, lock_vehicles
+
+# Maintenance of the daily_vehicle_stats rollup. Writers call the refresh_*
+# helpers before committing so the rollup changes in the same transaction as
+# the raw rows; `flask rollup rebuild` recomputes it from scratch.
+
+rollup_cli = AppGroup('rollup', help='Maintain the daily_vehicle_stats rollup table.')
+
+
+def reservation_days(start_time, end_time):
+    """First and last calendar day touched by a reservation"""
+    return start_time.date(), (end_time - timedelta(microseconds=1)).date()
+
+
+def _split_hours(start_time, end_time, first_day, last_day):
+    """Yield (day, hours) for the part of [start_time, end_time) within the days"""
+    day = max(start_time.date(), first_day)
+    last = min(reservation_days(start_time, end_time)[1], last_day)
+    while day <= last:
+        day_start = datetime.combine(day, time.min)
+        day_end = day_start + timedelta(days=1)
+        overlap = min(end_time, day_end) - max(start_time, day_start)
+        if overlap > timedelta(0):
+            yield day, overlap.total_seconds() / 3600
+        day += timedelta(days=1)
+
+
+def _merge(ranges):
+    """Sorted inclusive day ranges with overlapping and adjacent ones joined"""
+    merged = []
+    for first_day, last_day in sorted(ranges):
+        if merged and first_day <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last_day))
+        else:
+            merged.append((first_day, last_day))
+    return merged
+
+
+def refresh_vehicle_days(vehicle_id, first_day, last_day):
+    """Recompute the rollup rows of one vehicle for an inclusive day range"""
+    _refresh_ranges(vehicle_id, [(first_day, last_day)])
+
+
+def _refresh_ranges(vehicle_id, ranges):
+    """Recompute the rollup rows of one vehicle for inclusive day ranges.
+
+    All ranges share one set of queries. Takes the vehicle's booking lock,
+    so concurrent writers of one vehicle recompute its rows one after
+    another: each then sees the other's committed raw rows, and the delete
+    and insert never interleave.
+    """
+    ranges = _merge(ranges)
+    lock_vehicles(vehicle_id)
+    periods = [(datetime.combine(first_day, time.min), datetime.combine(last_day + timedelta(days=1), time.min))
+               for first_day, last_day in ranges]
+    stats = defaultdict(lambda: {
+        'reserved_hours': 0.0,
+        'reservation_count': 0,
+        'created_count': 0,
+        'service_cost': Decimal(0),
+        'damage_cost': Decimal(0)
+    })
+
+    def within(day):
+        return any(first_day <= day <= last_day for first_day, last_day in ranges)
+
+    reservations = db.session.query(Reservation.start_time, Reservation.end_time).filter(
+        Reservation.vehicle_id == vehicle_id,
+        or_(*[occupying_filter(period_start, period_end) for period_start, period_end in periods])
+    ).all()
+    for start_time, end_time in reservations:
+        for first_day, last_day in ranges:
+            for day, hours in _split_hours(start_time, end_time, first_day, last_day):
+                stats[day]['reserved_hours'] += hours
+        if within(start_time.date()):
+            stats[start_time.date()]['reservation_count'] += 1
+
+    created = db.session.query(Reservation.created_at).filter(
+        Reservation.vehicle_id == vehicle_id,
+        or_(*[and_(Reservation.created_at >= period_start, Reservation.created_at < period_end)
+              for period_start, period_end in periods])
+    ).all()
+    for created_at, in created:
+        stats[created_at.date()]['created_count'] += 1
+
+    services = db.session.query(ServiceRecord.service_date, ServiceRecord.cost).filter(
+        ServiceRecord.vehicle_id == vehicle_id,
+        or_(*[ServiceRecord.service_date.between(first_day, last_day) for first_day, last_day in ranges]),
+        ServiceRecord.cost.isnot(None)
+    ).all()
+    for service_date, cost in services:
+        stats[service_date]['service_cost'] += Decimal(cost)
+
+    damages = db.session.query(DamageRecord.damage_date, DamageRecord.actual_cost).filter(
+        DamageRecord.vehicle_id == vehicle_id,
+        or_(*[DamageRecord.damage_date.between(first_day, last_day) for first_day, last_day in ranges]),
+        DamageRecord.actual_cost.isnot(None)
+    ).all()
+    for damage_date, cost in damages:
+        stats[damage_date]['damage_cost'] += Decimal(cost)
+
+    DailyVehicleStat.query.filter(
+        DailyVehicleStat.vehicle_id == vehicle_id,
+        or_(*[DailyVehicleStat.date.between(first_day, last_day) for first_day, last_day in ranges])
+    ).delete(synchronize_session=False)
+
+    rows = [dict(vehicle_id=vehicle_id, date=day, **values) for day, values in sorted(stats.items())]
+    if rows:
+        db.session.execute(insert(DailyVehicleStat), rows)
+
+
+def refresh_bookings(vehicle_id, booking_spans, created_days=()):
+    """Refresh a vehicle's rollup after bookings of it were written.
+
+    booking_spans are the (first_day, last_day) of the bookings, before and
+    after the write. Their days are refreshed as one range and the days the
+    bookings were created on separately, so a booking made months ahead does
+    not rewrite every day in between.
+    """
+    first_day = min(first for first, last in booking_spans)
+    last_day = max(last for first, last in booking_spans)
+    _refresh_ranges(vehicle_id, [(first_day, last_day)] + [(day, day) for day in set(created_days)])
+
+
+def refresh_reservation(reservation, previous_span=None):
+    """Refresh the days a reservation covers, the days it covered before an update and its creation day"""
+    db.session.flush()
+    spans = [reservation_days(reservation.start_time, reservation.end_time)]
+    if previous_span:
+        spans.append(previous_span)
+    refresh_bookings(reservation.vehicle_id, spans, [(reservation.created_at or datetime.utcnow()).date()])
+
+
+def refresh_record(vehicle_id, *days):
+    """Refresh the days of a service or damage record (old and new date on updates)"""
+    db.session.flush()
+    days = [day for day in days if day]
+    if days:
+        refresh_vehicle_days(vehicle_id, min(days), max(days))
+
+
+def _vehicle_span(vehicle_id, since=None):
+    """Earliest and latest day with any raw data for a vehicle"""
+    bounds = [
+        db.session.query(func.min(Reservation.start_time), func.max(Reservation.end_time))
+        .filter(Reservation.vehicle_id == vehicle_id).one(),
+        db.session.query(func.min(Reservation.created_at), func.max(Reservation.created_at))
+        .filter(Reservation.vehicle_id == vehicle_id).one(),
+        db.session.query(func.min(ServiceRecord.service_date), func.max(ServiceRecord.service_date))
+        .filter(ServiceRecord.vehicle_id == vehicle_id).one(),
+        db.session.query(func.min(DamageRecord.damage_date), func.max(DamageRecord.damage_date))
+        .filter(DamageRecord.vehicle_id == vehicle_id).one()
+    ]
+    days = [value.date() if isinstance(value, datetime) else value
+            for pair in bounds for value in pair if value is not None]
+    if not days:
+        return None
+    first_day, last_day = min(days), max(days)
+    if since:
+        first_day = max(first_day, since)
+    return (first_day, last_day) if first_day <= last_day else None
+
+
+def rebuild(since=None, vehicle_ids=None):
+    """Recompute the rollup for all (or the given) vehicles, one transaction per vehicle"""
+    if vehicle_ids is None:
+        vehicle_ids = [vehicle_id for vehicle_id, in db.session.query(Vehicle.id).order_by(Vehicle.id)]
+    for vehicle_id in vehicle_ids:
+        span = _vehicle_span(vehicle_id, since)
+        if span:
+            refresh_vehicle_days(vehicle_id, *span)
+        db.session.commit()
+    return len(vehicle_ids)
+
+
+def needs_backfill():
+    """Whether the deployment has data but no rollup yet"""
+    return DailyVehicleStat.query.first() is None and Reservation.query.first() is not None
+
+
+def ensure_backfilled():
+    """Build the rollup for a deployment that already had data before it existed"""
+    if needs_backfill():
+        rebuild()
+        return True
+    return False
+
+
+@rollup_cli.command('rebuild')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Only recompute days from this date on.')
+@click.option('--vehicle-id', 'vehicle_ids', type=int, multiple=True, help='Restrict to these vehicles.')
+def rebuild_command(since, vehicle_ids):
+    """Recompute daily_vehicle_stats from the raw tables"""
+    count = rebuild(since=since.date() if since else None, vehicle_ids=list(vehicle_ids) or None)
+    click.echo(f'Rebuilt daily statistics for {count} vehicle(s)')
@@ -0,0 +1,217 @@
+import click
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from flask.cli import AppGroup
+from sqlalchemy import exists, insert, literal, select, update
+from src.models.models import db, Reservation, Vehicle, VehicleAlert, ScheduledJob
+from src.services.cache import mark_written
+from src.services.events import event_broker, make_event
+
+# Periodic maintenance jobs. Every worker runs a scheduler thread, but each
+# due job runs in one worker only: claiming a job moves its next_run_at
+# forward with a conditional UPDATE that exactly one transaction can win.
+# Jobs are idempotent set-based sweeps, so a run that dies halfway is simply
+# finished by the next one. With SCHEDULER_ENABLED=false no thread is
+# started and `flask jobs run-pending` can be run from cron or a sidecar.
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+# How often each worker looks for due jobs, in seconds
+SCHEDULER_TICK = float(os.environ.get('SCHEDULER_TICK', 30))
+# Rows changed per transaction by the reservation sweep
+SWEEP_BATCH_SIZE = 1000
+# Expiry dates this close are reported before they pass
+ALERT_WINDOW = timedelta(days=30)
+EXPIRY_COLUMNS = ('technical_inspection_expiry', 'highway_vignette_expiry',
+                  'emission_control_expiry', 'next_service_date')
+
+jobs_cli = AppGroup('jobs', help='Run and inspect scheduled maintenance jobs.')
+
+JOBS = {}  # name -> (interval, function returning a short result)
+
+
+def job(name, interval):
+    def decorator(f):
+        JOBS[name] = (interval, f)
+        return f
+    return decorator
+
+
+@job('complete_reservations', timedelta(minutes=5))
+def complete_reservations():
+    """Move confirmed reservations that have ended to Dokoncena"""
+    reservations = Reservation.__table__
+    # Reservation times are local, like the checks in the booking endpoints
+    now = datetime.now()
+    completed = 0
+    while True:
+        batch = select(reservations.c.id).where(
+            reservations.c.status == 'Potvrzena',
+            reservations.c.end_time <= now
+        ).order_by(reservations.c.id).limit(SWEEP_BATCH_SIZE)
+        rows = db.session.execute(
+            update(reservations)
+            .where(reservations.c.id.in_(batch.scalar_subquery()), reservations.c.status == 'Potvrzena')
+            .values(status='Dokoncena', updated_at=datetime.utcnow())
+            .returning(reservations.c.id, reservations.c.vehicle_id, reservations.c.user_id,
+                       reservations.c.start_time, reservations.c.end_time)
+        ).all()
+        if not rows:
+            break
+        event_broker.stage(db.session, [make_event('reservation.completed', {
+            'id': row.id,
+            'vehicle_id': row.vehicle_id,
+            'user_id': row.user_id,
+            'start_time': row.start_time.isoformat(),
+            'end_time': row.end_time.isoformat(),
+            'status': 'Dokoncena'
+        }) for row in rows])
+        # Core statements bypass the flush hooks, so the dashboard cache is told explicitly
+        mark_written(db.session, Reservation)
+        db.session.commit()
+        completed += len(rows)
+    return f'{completed} reservation(s) completed'
+
+
+@job('vehicle_expiry_alerts', timedelta(hours=1))
+def vehicle_expiry_alerts():
+    """Open alerts for expiry dates that are near or past, resolve renewed ones"""
+    alerts = VehicleAlert.__table__
+    vehicles = Vehicle.__table__
+    now = datetime.utcnow()
+    horizon = date.today() + ALERT_WINDOW
+    opened = resolved = 0
+    for kind in EXPIRY_COLUMNS:
+        due = vehicles.c[kind]
+        # The date moved on, or the vehicle left the fleet
+        resolved += db.session.execute(update(alerts).where(
+            alerts.c.kind == kind,
+            alerts.c.resolved_at.is_(None),
+            ~exists().where(vehicles.c.id == alerts.c.vehicle_id, vehicles.c.is_archived == False,
+                            due == alerts.c.due_date)
+        ).values(resolved_at=now)).rowcount
+        opened += db.session.execute(insert(alerts).from_select(
+            ['vehicle_id', 'kind', 'due_date', 'created_at'],
+            select(vehicles.c.id, literal(kind), due, literal(now)).where(
+                vehicles.c.is_archived == False,
+                due.isnot(None),
+                due <= horizon,
+                ~exists().where(alerts.c.vehicle_id == vehicles.c.id, alerts.c.kind == kind,
+                                alerts.c.due_date == due, alerts.c.resolved_at.is_(None))
+            )
+        )).rowcount
+    db.session.commit()
+    return f'{opened} alert(s) opened, {resolved} resolved'
+
+
+def ensure_jobs():
+    """Create the schedule rows of new jobs, due immediately"""
+    existing = {name for name, in db.session.query(ScheduledJob.name)}
+    for name in JOBS:
+        if name not in existing:
+            db.session.add(ScheduledJob(name=name, next_run_at=datetime.utcnow()))
+    db.session.commit()
+
+
+def _claim(name, interval):
+    """Whether this process won the due run of a job"""
+    jobs = ScheduledJob.__table__
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(jobs).where(jobs.c.name == name, jobs.c.next_run_at <= now)
+        .values(next_run_at=now + interval)
+    ).rowcount == 1
+    db.session.commit()
+    return claimed
+
+
+def run_job(name):
+    """Run a job now and record its outcome"""
+    interval, function = JOBS[name]
+    started_at = datetime.utcnow()
+    try:
+        result, error = function(), None
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Job %s failed', name)
+        result, error = 'failed', str(e)
+    scheduled = db.session.get(ScheduledJob, name)
+    if scheduled is not None:
+        scheduled.last_started_at = started_at
+        scheduled.last_finished_at = datetime.utcnow()
+        scheduled.last_result = result[:200]
+        scheduled.last_error = error
+        db.session.commit()
+    return result
+
+
+def run_pending():
+    """Run every due job this process manages to claim; returns (name, result) pairs"""
+    return [(name, run_job(name)) for name, (interval, function) in JOBS.items() if _claim(name, interval)]
+
+
+class Scheduler:
+    """Per-worker thread running due jobs every SCHEDULER_TICK seconds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self._loop, args=(app,), name='scheduler', daemon=True)
+                self._thread.start()
+
+    def _loop(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    run_pending()
+            except Exception:
+                logger.exception('Scheduler tick failed')
+            time.sleep(SCHEDULER_TICK)
+
+
+scheduler = Scheduler()
+
+
+def register_scheduler(app):
+    """Start this worker's scheduler on its first request, i.e. after gunicorn forked it"""
+    if not SCHEDULER_ENABLED:
+        return
+
+    @app.before_request
+    def _start_scheduler():
+        if not scheduler.running:
+            scheduler.start(app)
+
+
+@jobs_cli.command('run-pending')
+def run_pending_command():
+    """Run the jobs that are due; for cron or a sidecar"""
+    for name, result in run_pending():
+        click.echo(f'{name}: {result}')
+
+
+@jobs_cli.command('run')
+@click.argument('name', type=click.Choice(sorted(JOBS)))
+def run_command(name):
+    """Run one job now, regardless of its schedule"""
+    click.echo(f'{name}: {run_job(name)}')
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Show when each job last ran and runs next"""
+    for scheduled in ScheduledJob.query.order_by(ScheduledJob.name):
+        click.echo(f'{scheduled.name:24} next {scheduled.next_run_at:%Y-%m-%d %H:%M:%S}  '
+                   f'last {scheduled.last_result or "-"}{" (" + scheduled.last_error + ")" if scheduled.last_error else ""}')
@@ -0,0 +1,171 @@
+import click
+import random
+from datetime import date, datetime, timedelta
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, text
+from src.models.models import db, Role, User, Vehicle, Reservation, ServiceRecord, DamageRecord
+from src.services.passwords import hash_password
+from src.services.rollup import rebuild
+
+# Synthetic fleet data for benchmarks. Everything is generated from a fixed
+# random seed, so two runs with the same options produce the same dataset.
+# Never point this at a production database.
+
+seed_cli = AppGroup('seed', help='Generate synthetic fleet data for benchmarks.')
+
+BENCH_ADMIN = 'bench_admin'
+BENCH_PASSWORD = 'benchpass'
+BATCH_SIZE = 5000
+
+HISTORY = timedelta(days=730)
+HORIZON = timedelta(days=60)
+
+MAKES = {
+    'Škoda': ['Octavia', 'Fabia', 'Superb', 'Kodiaq', 'Enyaq'],
+    'Volkswagen': ['Golf', 'Passat', 'Transporter', 'ID.4'],
+    'Toyota': ['Corolla', 'Yaris', 'RAV4'],
+    'Hyundai': ['i30', 'Tucson', 'Kona'],
+    'Ford': ['Focus', 'Transit', 'Kuga'],
+}
+FUEL_TYPES = ['benzin', 'nafta', 'elektrina', 'hybrid']
+TRANSMISSIONS = ['manualni', 'automaticka']
+SEATS = [2, 4, 5, 5, 5, 7, 9]
+COLORS = ['bílá', 'černá', 'stříbrná', 'modrá', 'červená', 'šedá']
+DEPARTMENTS = ['Obchod', 'Servis', 'Logistika', 'Finance', 'IT', 'Marketing']
+DESTINATIONS = ['Praha', 'Brno', 'Ostrava', 'Plzeň', 'Olomouc', 'Liberec', 'České Budějovice', 'Hradec Králové']
+PURPOSES = ['Schůzka se zákazníkem', 'Servisní výjezd', 'Školení', 'Převoz materiálu', 'Veletrh']
+SERVICE_TYPES = ['Pravidelný servis', 'Výměna pneumatik', 'Výměna oleje', 'STK', 'Oprava brzd']
+PROVIDERS = ['AutoServis Praha', 'Garáž Brno', 'Pneu Centrum', 'Autorizovaný servis']
+DAMAGES = ['Poškrábaný nárazník', 'Prasklé čelní sklo', 'Promáčklé dveře', 'Rozbité zrcátko']
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def _users(rng, count):
+    """Benchmark admin plus count employees, created once; returns employee ids"""
+    if not User.query.filter_by(username=BENCH_ADMIN).first():
+        admin_role = Role.query.filter_by(name='Administrator').one()
+        user_role = Role.query.filter_by(name='Uživatel').one()
+        # One hash for every account; hashing each one would dominate seeding
+        password_hash = hash_password(BENCH_PASSWORD)
+        now = datetime.utcnow()
+        rows = [dict(username=BENCH_ADMIN, email=f'{BENCH_ADMIN}@bench.car11', password_hash=password_hash,
+                     full_name='Benchmark Admin', corporate_id='BENCH0000', department='IT',
+                     role_id=admin_role.id, is_active=True, created_at=now, updated_at=now)]
+        rows += [dict(username=f'bench_user_{n}', email=f'bench_user_{n}@bench.car11',
+                      password_hash=password_hash, full_name=f'Zaměstnanec {n}',
+                      corporate_id=f'BENCH{n:04d}', department=rng.choice(DEPARTMENTS),
+                      role_id=user_role.id, is_active=rng.random() > 0.03,
+                      created_at=now, updated_at=now) for n in range(1, count + 1)]
+        _insert(User, rows)
+    return [user_id for user_id, in db.session.query(User.id).filter(User.username.like('bench_user_%'))]
+
+
+def _vehicles(rng, count):
+    offset = db.session.query(func.count(Vehicle.id)).scalar()
+    today = date.today()
+    now = datetime.utcnow()
+    rows = []
+    for n in range(offset, offset + count):
+        make = rng.choice(list(MAKES))
+        archived = rng.random() < 0.03
+        rows.append(dict(
+            make=make, model=rng.choice(MAKES[make]), license_plate=f'B{n:06d}',
+            color=rng.choice(COLORS), fuel_type=rng.choice(FUEL_TYPES),
+            seating_capacity=rng.choice(SEATS), transmission=rng.choice(TRANSMISSIONS),
+            status='Archivovane' if archived else ('V udrzbe' if rng.random() < 0.04 else 'Aktivni'),
+            odometer=rng.randint(1000, 250000), is_archived=archived,
+            last_service_date=today - timedelta(days=rng.randint(0, 365)),
+            technical_inspection_expiry=today + timedelta(days=rng.randint(-30, 730)),
+            created_at=now, updated_at=now))
+    _insert(Vehicle, rows)
+    return [vehicle_id for vehicle_id, in
+            db.session.query(Vehicle.id).order_by(Vehicle.id).offset(offset).limit(count)]
+
+
+def _reservations(rng, vehicle_ids, user_ids, count):
+    """Non-overlapping bookings per vehicle spread over the history and horizon"""
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    start, end = now - HISTORY, now + HORIZON
+    per_vehicle = max(1, count // len(vehicle_ids))
+    mean_slot = (end - start) / per_vehicle
+    rows = []
+    for vehicle_id in vehicle_ids:
+        moment = start + timedelta(hours=rng.randint(0, 48))
+        for _ in range(per_vehicle):
+            duration = timedelta(hours=rng.choice([2, 3, 4, 8, 8, 9, 24, 48]))
+            if moment + duration > end:
+                break
+            if moment < now:
+                status = rng.choices(['Dokoncena', 'Potvrzena', 'Zrusena'], [60, 25, 15])[0]
+            else:
+                status = rng.choices(['Potvrzena', 'Zrusena'], [85, 15])[0]
+            created_at = min(moment, now) - timedelta(hours=rng.randint(1, 14 * 24))
+            rows.append(dict(
+                user_id=rng.choice(user_ids), vehicle_id=vehicle_id,
+                start_time=moment, end_time=moment + duration,
+                purpose=rng.choice(PURPOSES), destination=rng.choice(DESTINATIONS),
+                passenger_count=rng.randint(1, 4), status=status,
+                created_at=created_at, updated_at=created_at))
+            # Gaps average out so the vehicle's bookings fill the whole window
+            gap = max(timedelta(hours=1), (mean_slot - duration) * rng.uniform(0.2, 1.8))
+            moment = (moment + duration + gap).replace(minute=0, second=0, microsecond=0)
+        if len(rows) >= BATCH_SIZE:
+            _insert(Reservation, rows)
+            rows = []
+    _insert(Reservation, rows)
+
+
+def _history(rng, vehicle_ids, services_per_vehicle, damages_per_vehicle):
+    today = date.today()
+    now = datetime.utcnow()
+    services, damages = [], []
+    for vehicle_id in vehicle_ids:
+        for _ in range(services_per_vehicle):
+            services.append(dict(
+                vehicle_id=vehicle_id, service_date=today - timedelta(days=rng.randint(0, HISTORY.days)),
+                service_type=rng.choice(SERVICE_TYPES), description='Synthetic service record',
+                cost=round(rng.uniform(800, 25000), 2), service_provider=rng.choice(PROVIDERS),
+                created_at=now, updated_at=now))
+        for _ in range(rng.randint(0, 2 * damages_per_vehicle)):
+            repaired = rng.random() < 0.8
+            estimated = round(rng.uniform(1000, 60000), 2)
+            damages.append(dict(
+                vehicle_id=vehicle_id, damage_date=today - timedelta(days=rng.randint(0, HISTORY.days)),
+                description=rng.choice(DAMAGES), estimated_cost=estimated,
+                actual_cost=round(estimated * rng.uniform(0.7, 1.3), 2) if repaired else None,
+                repair_status='Opraveno' if repaired else 'Ceka na opravu',
+                created_at=now, updated_at=now))
+    _insert(ServiceRecord, services)
+    _insert(DamageRecord, damages)
+
+
+def seed(vehicles, users, reservations, services_per_vehicle, damages_per_vehicle, random_seed=11):
+    """Add a synthetic fleet with its booking and maintenance history"""
+    rng = random.Random(random_seed)
+    user_ids = _users(rng, users)
+    vehicle_ids = _vehicles(rng, vehicles)
+    _reservations(rng, vehicle_ids, user_ids, reservations)
+    _history(rng, vehicle_ids, services_per_vehicle, damages_per_vehicle)
+    db.session.commit()
+    rebuild(vehicle_ids=vehicle_ids)
+    # Fresh planner statistics, so EXPLAIN and benchmarks see realistic plans
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+@seed_cli.command('fleet')
+@click.option('--vehicles', default=2000, show_default=True)
+@click.option('--users', default=500, show_default=True)
+@click.option('--reservations', default=200000, show_default=True)
+@click.option('--services-per-vehicle', default=8, show_default=True)
+@click.option('--damages-per-vehicle', default=2, show_default=True)
+@click.option('--random-seed', default=11, show_default=True)
+def seed_fleet_command(vehicles, users, reservations, services_per_vehicle, damages_per_vehicle, random_seed):
+    """Seed vehicles, users, reservations and maintenance history"""
+    seed(vehicles, users, reservations, services_per_vehicle, damages_per_vehicle, random_seed)
+    click.echo(f'Seeded {vehicles} vehicles and about {reservations} reservations; '
+               f'log in as {BENCH_ADMIN} / {BENCH_PASSWORD}')
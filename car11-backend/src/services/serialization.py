@@ -0,0 +1,22 @@
+from sqlalchemy.orm import joinedload
+from src.models.models import User, Reservation, ServiceRecord, DamageRecord
+
+# Eager-loading profiles per serialized model. Each profile loads exactly the
+# relationships its to_dict() touches, so serializing a list costs one query
+# no matter how many rows it has.
+LOAD_PROFILES = {
+    'user': lambda: (joinedload(User.role),),
+    'reservation': lambda: (joinedload(Reservation.user), joinedload(Reservation.vehicle)),
+    'service_record': lambda: (joinedload(ServiceRecord.vehicle),),
+    'damage_record': lambda: (joinedload(DamageRecord.vehicle),),
+}
+
+
+def with_profile(query, profile):
+    """Apply the eager-loading options of a profile to a query"""
+    return query.options(*LOAD_PROFILES[profile]())
+
+
+def serialize_all(query, profile):
+    """Load a query with its profile and serialize every row"""
+    return [item.to_dict() for item in with_profile(query, profile).all()]
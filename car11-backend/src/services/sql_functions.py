@@ -0,0 +1,26 @@
+from sqlalchemy import String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+# Portable SQL helpers for report queries. Each construct compiles to the
+# native expression of the database in use so that SQLite (local development)
+# and PostgreSQL (production) return the same results.
+
+
+class year_month(FunctionElement):
+    """Calendar month of a date or timestamp formatted as YYYY-MM"""
+    type = String()
+    name = 'year_month'
+    inherit_cache = True
+
+
+@compiles(year_month)
+def _year_month_default(element, compiler, **kw):
+    value, = list(element.clauses)
+    return "to_char(%s, 'YYYY-MM')" % compiler.process(value, **kw)
+
+
+@compiles(year_month, 'sqlite')
+def _year_month_sqlite(element, compiler, **kw):
+    value, = list(element.clauses)
+    return "strftime('%%Y-%%m', %s)" % compiler.process(value, **kw)
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+import uuid
+import jwt
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from src.models.models import db, RevokedToken
+
+# Optional stateless authentication. A signed access token carries everything
+# the authorization decorators need, so a request presenting one is served
+# without a user lookup. Access tokens are short-lived; refresh tokens are
+# exchanged for a new pair after re-reading the user from the database.
+
+TOKEN_ALGORITHM = 'HS256'
+ACCESS_TOKEN_TTL = timedelta(seconds=int(os.environ.get('ACCESS_TOKEN_TTL', 900)))
+REFRESH_TOKEN_TTL = timedelta(seconds=int(os.environ.get('REFRESH_TOKEN_TTL', 14 * 24 * 3600)))
+
+# Revocations written by other workers become visible to this one at most
+# this much later.
+REVOCATION_SYNC_INTERVAL = timedelta(seconds=5)
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def tokens_enabled():
+    return os.environ.get('TOKEN_AUTH_ENABLED', 'false').lower() == 'true'
+
+
+def _secret():
+    return os.environ.get('TOKEN_SECRET_KEY') or current_app.config['SECRET_KEY']
+
+
+def _encode(claims, ttl):
+    now = time.time()
+    claims = dict(claims, iat=now, exp=now + ttl.total_seconds(), jti=str(uuid.uuid4()))
+    return jwt.encode(claims, _secret(), algorithm=TOKEN_ALGORITHM)
+
+
+def issue_tokens(principal):
+    """Access and refresh token pair for a principal"""
+    access_token = _encode({
+        'type': 'access',
+        'sub': str(principal.id),
+        'username': principal.username,
+        'active': principal.is_active,
+        'role_id': principal.role_id,
+        'role': principal.role_name
+    }, ACCESS_TOKEN_TTL)
+    refresh_token = _encode({'type': 'refresh', 'sub': str(principal.id)}, REFRESH_TOKEN_TTL)
+    return {
+        'access_token': access_token,
+        'refresh_token': refresh_token,
+        'token_type': 'Bearer',
+        'expires_in': int(ACCESS_TOKEN_TTL.total_seconds())
+    }
+
+
+def decode_token(token, token_type):
+    """Verified claims of a token of the given type that has not been revoked"""
+    try:
+        claims = jwt.decode(token, _secret(), algorithms=[TOKEN_ALGORITHM],
+                            options={'require': ['exp', 'iat', 'jti', 'sub']})
+    except jwt.PyJWTError as e:
+        raise InvalidToken(str(e)) from e
+    if claims.get('type') != token_type:
+        raise InvalidToken(f'Expected a {token_type} token')
+    if revocation_list.is_revoked(claims):
+        raise InvalidToken('Token has been revoked')
+    return claims
+
+
+def _token_entry(claims):
+    return RevokedToken(
+        jti=claims['jti'],
+        user_id=int(claims['sub']),
+        expires_at=datetime.utcfromtimestamp(claims['exp'])
+    )
+
+
+def revoke_token(claims):
+    """Revoke a single token until it expires"""
+    _store(_token_entry(claims))
+
+
+def claim_token(claims):
+    """Use up a single-use token; False when another request already did.
+
+    The unique jti of revoked_tokens makes the claim atomic across threads
+    and workers, so exactly one of several concurrent claims succeeds.
+    """
+    try:
+        _store(_token_entry(claims))
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def revoke_user_tokens(*user_ids):
+    """Revoke every token issued to the users so far, e.g. after a role change"""
+    expires_at = datetime.utcnow() + REFRESH_TOKEN_TTL
+    _store(*[RevokedToken(user_id=user_id, expires_at=expires_at) for user_id in user_ids])
+
+
+def _store(*entries):
+    """Insert revocations in one transaction, then add them to this process's list"""
+    # Expired entries no longer match any valid token
+    RevokedToken.query.filter(RevokedToken.expires_at < datetime.utcnow()).delete(synchronize_session=False)
+    db.session.add_all(entries)
+    db.session.flush()
+    # Read before the commit expires the instances
+    added = [(entry.jti, entry.user_id, entry.revoked_at) for entry in entries]
+    db.session.commit()
+    for jti, user_id, revoked_at in added:
+        revocation_list.add(jti, user_id, revoked_at)
+
+
+class RevocationList:
+    """Process-local copy of the revoked_tokens table.
+
+    Token checks consult memory only; the copy is refreshed from rows revoked
+    since the last sync at most every REVOCATION_SYNC_INTERVAL.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._jtis = set()
+        self._users = {}  # user_id -> latest revoked_at of a user-wide revocation
+        self._synced_at = None
+        self._checked_at = None
+
+    def load(self):
+        """(Re)read every unexpired revocation"""
+        synced_at = datetime.utcnow()
+        rows = db.session.query(RevokedToken.jti, RevokedToken.user_id, RevokedToken.revoked_at) \
+            .filter(RevokedToken.expires_at >= synced_at).all()
+        with self._lock:
+            self._jtis = set()
+            self._users = {}
+            for row in rows:
+                self._add(*row)
+            self._synced_at = synced_at
+            self._checked_at = datetime.utcnow()
+
+    def sync(self):
+        now = datetime.utcnow()
+        with self._lock:
+            if self._synced_at is None:
+                return self.load()
+            if now - self._checked_at < REVOCATION_SYNC_INTERVAL:
+                return
+            # Small overlap with the previous window tolerates clock skew between workers
+            since = self._synced_at - REVOCATION_SYNC_INTERVAL
+            self._checked_at = now
+        rows = db.session.query(RevokedToken.jti, RevokedToken.user_id, RevokedToken.revoked_at) \
+            .filter(RevokedToken.revoked_at >= since).all()
+        with self._lock:
+            for row in rows:
+                self._add(*row)
+            self._synced_at = now
+
+    def add(self, jti, user_id, revoked_at):
+        with self._lock:
+            self._add(jti, user_id, revoked_at)
+
+    def is_revoked(self, claims):
+        self.sync()
+        issued_at = datetime.utcfromtimestamp(claims['iat'])
+        with self._lock:
+            if claims['jti'] in self._jtis:
+                return True
+            revoked_at = self._users.get(int(claims['sub']))
+            return revoked_at is not None and issued_at <= revoked_at
+
+    def _add(self, jti, user_id, revoked_at):
+        if jti is not None:
+            self._jtis.add(jti)
+        elif user_id is not None:
+            self._users[user_id] = max(revoked_at, self._users.get(user_id, revoked_at))
+
+
+revocation_list = RevocationList()
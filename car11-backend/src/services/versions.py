@@ -0,0 +1,110 @@
+import os
+from datetime import datetime
+from functools import wraps
+from flask import request, make_response
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+from src.models.models import db, User, Role, Vehicle, TableVersion
+from src.services.cache import LRUCache
+from src.services.conditional import make_etag, not_modified, with_validator
+
+# Version counters of rarely changing reference tables. Every flush or bulk
+# statement writing one of VERSIONED_MODELS bumps the table's counter in the
+# same transaction, so all workers see the new version as soon as the write
+# commits. Conditional GETs are answered from the counters alone, and the
+# serialized responses are cached per worker keyed by the versions they saw.
+
+VERSIONED_MODELS = (Vehicle, User, Role)
+
+response_cache = LRUCache(
+    maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', 64)),
+    ttl=int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+)
+
+_versions = TableVersion.__table__
+
+
+def table_versions(*names):
+    """(version, updated_at) per table name in one query; (0, None) if never written"""
+    rows = {row.name: row for row in db.session.query(TableVersion.name, TableVersion.version,
+                                                      TableVersion.updated_at)
+            .filter(TableVersion.name.in_(names))}
+    return [(rows[name].version, rows[name].updated_at) if name in rows else (0, None) for name in names]
+
+
+def ensure_versions():
+    """Create the counter rows, so concurrent first writes only ever update"""
+    existing = {name for name, in db.session.query(TableVersion.name)}
+    for model in VERSIONED_MODELS:
+        if model.__tablename__ not in existing:
+            db.session.add(TableVersion(name=model.__tablename__, version=0))
+    db.session.commit()
+
+
+def _bump(connection, tables):
+    now = datetime.utcnow()
+    # Fixed order, so two transactions bumping several tables cannot deadlock
+    for name in sorted(tables):
+        result = connection.execute(update(_versions).where(_versions.c.name == name)
+                                    .values(version=_versions.c.version + 1, updated_at=now))
+        if result.rowcount == 0:
+            connection.execute(insert(_versions).values(name=name, version=1, updated_at=now))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_flushed_tables(session, flush_context):
+    changed = [instance for instance in session.new | session.deleted if isinstance(instance, VERSIONED_MODELS)]
+    changed += [instance for instance in session.dirty
+                if isinstance(instance, VERSIONED_MODELS) and session.is_modified(instance)]
+    if changed:
+        _bump(session.connection(), {type(instance).__tablename__ for instance in changed})
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_statement_tables(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the flush, e.g. the seeder
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, VERSIONED_MODELS):
+        _bump(orm_execute_state.session.connection(), {mapper.class_.__tablename__})
+
+
+def versioned(*tables, cacheable=lambda: not request.args):
+    """Answer a GET view from the version counters of the tables it reads.
+
+    The ETag comes from the counters, so a client holding the current version
+    gets a 304 without the rows being loaded; Last-Modified is informational.
+    When cacheable() holds for the request, the serialized 200 response is
+    cached and served again until one of the tables changes.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            versions = table_versions(*tables)
+            etag = make_etag(request.full_path, *[version for version, updated_at in versions])
+            stamps = [updated_at for version, updated_at in versions if updated_at]
+            last_modified = max(stamps) if stamps else None
+            response = not_modified(etag, last_modified)
+            if response is not None:
+                return response
+
+            key = (request.path, request.query_string, tuple(versions))
+            use_cache = cacheable()
+            cached = response_cache.get(key) if use_cache else None
+            if cached is not None:
+                body, headers = cached
+                response = make_response(body)
+                response.headers.update(headers)
+                response.mimetype = 'application/json'
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if use_cache:
+                    response_cache.set(key, (response.get_data(), [
+                        (name, value) for name, value in response.headers.items()
+                        if name.startswith('X-')]))
+            return with_validator(response, etag, last_modified)
+        return decorated_function
+    return decorator